@@ -0,0 +1,74 @@
+"""Account deletion.
+
+Deleting an account only marks the user deleted; it's hidden right away and
+the request returns immediately. A background job then purges the user's
+rows in bounded batches, one short transaction per batch, so a heavy account
+never holds long locks on `messages` or `likes`.
+
+Follows are purged like unfollows: each removed edge is logged to the follow
+graph index and queues the suggestion refreshes it affects.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import text
+
+import follow_graph
+import jobs
+import suggestions
+from models import db, User
+
+# Rows deleted per table per job run.
+PURGE_BATCH = 1000
+
+# Each step deletes up to :n follows involving :uid, returning the edges.
+PURGE_FOLLOWS_STEPS = [
+    """DELETE FROM follows WHERE ctid IN (
+           SELECT ctid FROM follows WHERE user_following_id = :uid LIMIT :n)
+       RETURNING user_following_id, user_being_followed_id""",
+    """DELETE FROM follows WHERE ctid IN (
+           SELECT ctid FROM follows WHERE user_being_followed_id = :uid LIMIT :n)
+       RETURNING user_following_id, user_being_followed_id""",
+]
+
+# Each step deletes up to :n other rows belonging to :uid.
+PURGE_STEPS = [
+    """DELETE FROM likes WHERE id IN (
+           SELECT id FROM likes WHERE user_id = :uid LIMIT :n)""",
+    """DELETE FROM likes WHERE id IN (
+           SELECT likes.id FROM likes JOIN messages ON messages.id = likes.message_id
+           WHERE messages.user_id = :uid LIMIT :n)""",
+    """DELETE FROM messages WHERE id IN (
+           SELECT id FROM messages WHERE user_id = :uid LIMIT :n)""",
+    """DELETE FROM message_deletions WHERE id IN (
+           SELECT id FROM message_deletions WHERE user_id = :uid LIMIT :n)""",
+]
+
+
+def soft_delete_user(user):
+    """Mark `user` deleted and queue the purge of their data."""
+
+    user.deleted_at = datetime.utcnow()
+    jobs.enqueue('purge_user', dedupe_key=f'purge_user:{user.id}', user_id=user.id)
+
+
+@jobs.job()
+def purge_user(user_id):
+    """Delete one batch of a deleted user's rows, requeueing until done."""
+
+    for step in PURGE_FOLLOWS_STEPS:
+        edges = db.session.execute(text(step), {'uid': user_id, 'n': PURGE_BATCH}).all()
+        for follower_id, followed_id in edges:
+            follow_graph.record(db.session, follow_graph.UNFOLLOW, follower_id, followed_id)
+            suggestions.on_follow_changed(follower_id, followed_id)
+        if edges:
+            jobs.enqueue('purge_user', user_id=user_id)
+            return
+
+    for step in PURGE_STEPS:
+        result = db.session.execute(text(step), {'uid': user_id, 'n': PURGE_BATCH})
+        if result.rowcount:
+            jobs.enqueue('purge_user', user_id=user_id)
+            return
+
+    User.query.filter(User.id == user_id, User.deleted_at.isnot(None)).delete()
@@ -1,17 +1,64 @@
+import functools
 import os
 
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, flash, redirect, session, g, url_for, abort
-from flask_debugtoolbar import DebugToolbarExtension
+from flask import Flask, Response, render_template, stream_template, request, flash, redirect, session, g, url_for, abort, jsonify
+from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import create_engine
 
+import accounts
+import assets
+import compression
+import follow_graph
+import jobs
+import live
+import markup
+import memtrace
+import metrics
+import partitions
+import profiling
+import slow_queries
+import ranking
+import suggestions
+import template_cache
+import tracing
+import trending
+import uploads
 from forms import UserAddForm, LoginForm, MessageForm, EditProfileForm
-from models import db, connect_db, User, Message, Likes
+from models import db, connect_db, init_db, LIKES_PER_PAGE, User, Message, Likes, Follows, MessageDeletion, MessageTag, Notification, TrendingMessage
 
 CURR_USER_KEY = "curr_user"
+
+# Most messages /messages/since returns at once.
+SINCE_LIMIT = 100
 load_dotenv()
 
+def buffered(chunks, size=8192):
+    """Regroup a template stream's many small strings into ~`size` pieces.
+
+    Jinja yields a string per template node; sending each one on its own
+    would mean a socket write (and a compression flush) per fragment.
+    """
+
+    pending, length = [], 0
+    for chunk in chunks:
+        pending.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(pending)
+            pending, length = [], 0
+    if pending:
+        yield ''.join(pending)
+
+
+def add_template_helpers(app):
+    """Template globals and filters, for this app and asgi.py's Quart app."""
+
+    app.add_template_global(functools.partial(assets.asset_url, app=app), 'asset_url')
+    app.add_template_filter(uploads.thumb)
+    app.add_template_filter(markup.linkify)
+
+
 def create_app(db_name, testing=False):
     app = Flask(__name__)
     
@@ -24,21 +71,100 @@ def create_app(db_name, testing=False):
     app.config['SQLALCHEMY_ECHO'] = False
     app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
+    app.config['ASSETS_DIST'] = os.path.join(app.static_folder, 'dist')
+    app.config['FOLLOW_GRAPH_PATH'] = os.environ.get(
+        'FOLLOW_GRAPH_PATH', os.path.join(app.instance_path, 'follow_graph.bin'))
+    app.config['UPLOADS_DIR'] = os.environ.get(
+        'UPLOADS_DIR', os.path.join(app.instance_path, 'uploads'))
+    app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024
+    app.config['PROFILE_SECRET'] = os.environ.get('PROFILE_SECRET')
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_DIR'] = os.environ.get(
+        'PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 250))
+    app.config['SLOW_QUERY_LOG'] = os.environ.get(
+        'SLOW_QUERY_LOG', os.path.join(app.instance_path, 'slow_queries.log'))
+    app.config['SLOW_QUERY_PER_MINUTE'] = int(os.environ.get('SLOW_QUERY_PER_MINUTE', 30))
+    app.config['SLOW_QUERY_EXPLAIN'] = os.environ.get('SLOW_QUERY_EXPLAIN', '1') != '0'
+    app.config['TRACE_FILE'] = os.environ.get('TRACE_FILE')
+    app.config['TRACE_SAMPLE_RATE'] = float(os.environ.get('TRACE_SAMPLE_RATE', 1))
+    app.config['MEMTRACE_SAMPLE_RATE'] = float(os.environ.get('MEMTRACE_SAMPLE_RATE', 0))
+    app.config['MEMTRACE_LOG'] = os.environ.get(
+        'MEMTRACE_LOG', os.path.join(app.instance_path, 'memtrace.log'))
+    app.config['JINJA_CACHE_DIR'] = os.environ.get(
+        'JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+    app.config['ARCHIVE_DIR'] = os.environ.get(
+        'ARCHIVE_DIR', os.path.join(app.instance_path, 'archive'))
+    app.config['ARCHIVE_AFTER_MONTHS'] = int(os.environ.get('ARCHIVE_AFTER_MONTHS', 12))
+    app.config['LIVE_MAX_STREAMS'] = int(os.environ.get('LIVE_MAX_STREAMS', 4))
+    app.config['LIVE_STREAM_SECONDS'] = int(os.environ.get('LIVE_STREAM_SECONDS', 300))
 
     if testing:
         app.config['TESTING'] = True
         app.config['SQLALCHEMY_ECHO'] = True
 
-    # toolbar = DebugToolbarExtension(app)
+    # The toolbar is only useful in development; importing it costs every
+    # worker startup time, so only pull it in when it's asked for.
+    if os.environ.get('DEBUG_TOOLBAR'):
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    template_cache.init_app(app)
+    add_template_helpers(app)
+
+    # A no-op unless PROFILE_SECRET or PROFILE_SAMPLE_RATE is set.
+    profiling.init_app(app)
+
+    # Levels and thresholds are explained in compression.py.
+    app.wsgi_app = compression.Compress(app.wsgi_app)
+
+    # Instrumentation; each module says what turns it on.
+    metrics.init_app(app)
+    slow_queries.init_app(app)
+    tracing.init_app(app)
+    memtrace.init_app(app)
+
+    # No database work happens here: the factory must be safe to run once in
+    # the gunicorn master (--preload) before workers fork. Tables are created
+    # by `flask init-db`, never at import.
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create all database tables."""
+
+        init_db(app)
+        print("Initialized the database.")
 
-    # connect_db(app)
+    app.cli.add_command(assets.cli)
+    app.cli.add_command(follow_graph.cli)
+    app.cli.add_command(jobs.cli)
+    app.cli.add_command(memtrace.cli)
+    app.cli.add_command(partitions.cli)
+    app.cli.add_command(profiling.cli)
+    app.cli.add_command(ranking.cli)
+    app.cli.add_command(suggestions.cli)
+    app.cli.add_command(template_cache.cli)
+    app.cli.add_command(trending.cli)
 
-    engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
-    try:
-        with engine.connect() as connection:
-            print("Database connection successful")
-    except Exception as e:
-        print(f'Database connection failed: {eval}')
+
+    @app.route('/assets/<path:filename>')
+    def send_asset(filename):
+        """Serve a fingerprinted static file; see assets.py."""
+
+        return assets.send_asset(filename)
+
+    @app.route('/metrics')
+    def show_metrics():
+        """Prometheus scrape endpoint; see metrics.py."""
+
+        return metrics.render()
+
+
+    @app.route('/uploads/<path:filename>')
+    def send_upload(filename):
+        """Serve an uploaded profile image; see uploads.py."""
+
+        return uploads.send_upload(filename)
 
 
     ##############################################################################
@@ -49,11 +175,15 @@ def create_app(db_name, testing=False):
     def add_user_to_g():
         """If we're logged in, add curr user to Flask global."""
 
-        if CURR_USER_KEY in session:
-            g.user = User.query.get(session[CURR_USER_KEY])
+        with tracing.span('add_user_to_g'):
+            if CURR_USER_KEY in session:
+                g.user = User.query.get(session[CURR_USER_KEY])
 
-        else:
-            g.user = None
+                if g.user and g.user.deleted_at:
+                    g.user = None
+
+            else:
+                g.user = None
 
 
     def do_login(user):
@@ -69,6 +199,12 @@ def create_app(db_name, testing=False):
             del session[CURR_USER_KEY]
 
 
+    def get_user_or_404(user_id):
+        """Get a user that hasn't deleted their account, or 404."""
+
+        return User.query.filter_by(id=user_id, deleted_at=None).first_or_404()
+
+
     @app.route('/signup', methods=["GET", "POST"])
     def signup():
         """Handle user signup.
@@ -84,12 +220,20 @@ def create_app(db_name, testing=False):
         form = UserAddForm()
 
         if form.validate_on_submit():
+            image_url = form.image_url.data or User.image_url.default.arg
+            if form.image_file.data:
+                try:
+                    image_url = uploads.save_image(form.image_file.data, 'avatar')
+                except uploads.InvalidImage as e:
+                    flash(str(e), 'danger')
+                    return render_template('users/signup.html', form=form)
+
             try:
                 user = User.signup(
                     username=form.username.data,
                     password=form.password.data,
                     email=form.email.data,
-                    image_url=form.image_url.data or User.image_url.default.arg,
+                    image_url=image_url,
                 )
                 db.session.commit()
 
@@ -142,36 +286,38 @@ def create_app(db_name, testing=False):
     def list_users():
         """Page with listing of users.
 
-        Can take a 'q' param in querystring to search by that username.
+        Can take a 'q' param in querystring to search by that username, and
+        'sort=popular' to list the most influential users first.
         """
 
         search = request.args.get('q')
+        sort = request.args.get('sort')
+
+        users = User.query.filter(User.deleted_at.is_(None))
+
+        if sort == 'popular':
+            users = users.order_by(User.popularity.desc(), User.id)
 
         if not search:
-            users = User.query.all()
+            users = users.all()
         else:
-            users = User.query.filter(User.username.like(f"%{search}%")).all()
+            users = users.filter(User.username.like(f"%{search}%")).all()
 
-        return render_template('users/index.html', users=users)
+        return render_template('users/index.html', users=users, search=search, sort=sort)
 
 
     @app.route('/users/<int:user_id>', methods=['GET', 'POST'])
     def users_show(user_id):
         """Show user profile."""
 
-        user = User.query.get_or_404(user_id)
+        user = get_user_or_404(user_id)
         liked_message_ids = []
 
         likes_count = len(user.likes)
 
         # snagging messages in order from the database;
         # user.messages won't be in order by default
-        messages = (Message
-                    .query
-                    .filter(Message.user_id == user_id)
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
+        messages = Message.newest(Message.query.filter(Message.user_id == user_id), 100)
         
  
         likes = (Likes.query.filter_by(user_id=user_id).all())
@@ -190,7 +336,43 @@ def create_app(db_name, testing=False):
             was_liked = toggle_like_message(g.user.id, message_id)
             liked_message_ids = set(Likes.query.filter_by(user_id=user_id).all())
 
-        return render_template('users/show.html', user=user, messages=messages, location=location, bio=bio, header_image_url=header_image_url, likes_count=likes_count, liked_message_ids=liked_message_ids)
+        archived_months = partitions.archived_months(app.config['ARCHIVE_DIR'])
+
+        return render_template('users/show.html', user=user, messages=messages, location=location, bio=bio, header_image_url=header_image_url, likes_count=likes_count, liked_message_ids=liked_message_ids, archived_months=archived_months)
+
+
+    @app.route('/users/@<username>')
+    def users_show_by_username(username):
+        """Follow an @mention link to the user's profile."""
+
+        user = User.query.filter_by(username=username, deleted_at=None).first_or_404()
+        return redirect(url_for('users_show', user_id=user.id))
+
+
+    @app.route('/users/<int:user_id>/archive')
+    def users_archive(user_id):
+        """Show a user's messages from an archived month; see partitions.py."""
+
+        user = get_user_or_404(user_id)
+        months = partitions.archived_months(app.config['ARCHIVE_DIR'])
+
+        month = request.args.get('month')
+        if month:
+            try:
+                month = partitions.parse_month(month)
+            except ValueError:
+                abort(404)
+        else:
+            month = months[0] if months else None
+
+        messages = []
+        if month is not None:
+            messages = list(partitions.read_archive(app.config['ARCHIVE_DIR'], month, user.id))
+            messages.reverse()
+
+        return render_template('users/archive.html', user=user, messages=messages,
+                               month=month, months=months, location=user.location,
+                               bio=user.bio, likes_count=len(user.likes))
 
 
     @app.route('/users/<int:user_id>/following')
@@ -201,11 +383,15 @@ def create_app(db_name, testing=False):
             flash("Access unauthorized.", "danger")
             return redirect("/")
 
-        user = User.query.get_or_404(user_id)
+        user = get_user_or_404(user_id)
+        following, next_cursor = user.following_page(before=request.args.get('before'))
+        followed_ids = g.user.following_ids_among(u.id for u in following)
 
-        likes_count = len(user.likes)
-        
-        return render_template('users/following.html', user=user, likes_count=likes_count)
+        likes_count = Likes.query.filter_by(user_id=user_id).count()
+
+        return render_template('users/following.html', user=user, likes_count=likes_count,
+                               following=following, followed_ids=followed_ids,
+                               next_cursor=next_cursor)
 
 
     @app.route('/users/<int:user_id>/followers')
@@ -216,10 +402,15 @@ def create_app(db_name, testing=False):
             flash("Access unauthorized.", "danger")
             return redirect("/")
 
-        user = User.query.get_or_404(user_id)
-        likes_count = len(user.likes)
+        user = get_user_or_404(user_id)
+        followers, next_cursor = user.followers_page(before=request.args.get('before'))
+        followed_ids = g.user.following_ids_among(u.id for u in followers)
+
+        likes_count = Likes.query.filter_by(user_id=user_id).count()
 
-        return render_template('users/followers.html', user=user, likes_count=likes_count)
+        return render_template('users/followers.html', user=user, likes_count=likes_count,
+                               followers=followers, followed_ids=followed_ids,
+                               next_cursor=next_cursor)
 
 
     @app.route('/users/follow/<int:follow_id>', methods=['POST'])
@@ -230,8 +421,11 @@ def create_app(db_name, testing=False):
             flash("Access unauthorized.", "danger")
             return redirect("/")
 
-        followed_user = User.query.get_or_404(follow_id)
-        g.user.following.append(followed_user)
+        followed_user = get_user_or_404(follow_id)
+        db.session.merge(Follows(user_following_id=g.user.id,
+                                 user_being_followed_id=followed_user.id))
+        follow_graph.record(db.session, follow_graph.FOLLOW, g.user.id, followed_user.id)
+        suggestions.on_follow_changed(g.user.id, followed_user.id)
         db.session.commit()
 
         return redirect(f"/users/{g.user.id}/following")
@@ -245,8 +439,11 @@ def create_app(db_name, testing=False):
             flash("Access unauthorized.", "danger")
             return redirect("/")
 
-        followed_user = User.query.get(follow_id)
-        g.user.following.remove(followed_user)
+        (Follows.query
+         .filter_by(user_following_id=g.user.id, user_being_followed_id=follow_id)
+         .delete())
+        follow_graph.record(db.session, follow_graph.UNFOLLOW, g.user.id, follow_id)
+        suggestions.on_follow_changed(g.user.id, follow_id)
         db.session.commit()
 
         return redirect(f"/users/{g.user.id}/following")
@@ -259,7 +456,7 @@ def create_app(db_name, testing=False):
             flash("Access unauthorized.", "danger")
             return redirect("/")
         
-        form = EditProfileForm()
+        form = EditProfileForm(obj=g.user)
 
         if form.validate_on_submit():
             try:
@@ -271,9 +468,20 @@ def create_app(db_name, testing=False):
                 flash("Incorrect password.", 'danger')
                 return redirect('/')
             
+            try:
+                image_url = form.image_url.data
+                if form.image_file.data:
+                    image_url = uploads.save_image(form.image_file.data, 'avatar')
+                header_image_url = form.header_image_url.data
+                if form.header_image_file.data:
+                    header_image_url = uploads.save_image(form.header_image_file.data, 'header')
+            except uploads.InvalidImage as e:
+                flash(str(e), 'danger')
+                return render_template('users/edit.html', user=g.user, form=form)
+
             g.user.email = form.email.data
-            g.user.image_url = form.image_url.data
-            g.user.header_image_url = form.header_image_url.data
+            g.user.image_url = image_url
+            g.user.header_image_url = header_image_url
             g.user.bio = form.bio.data
 
             db.session.commit()
@@ -292,12 +500,50 @@ def create_app(db_name, testing=False):
 
         do_logout()
 
-        db.session.delete(g.user)
+        accounts.soft_delete_user(g.user)
         db.session.commit()
 
         return redirect("/signup")
 
 
+    ##############################################################################
+    # Notifications routes:
+
+    @app.route('/notifications')
+    def show_notifications():
+        """Show the messages mentioning the current user, newest first.
+
+        Opening the first page marks what it shows read. That's done before
+        the page is read, so a mention arriving meanwhile stays unread.
+        """
+
+        if not g.user:
+            flash("Access unauthorized.", "danger")
+            return redirect("/")
+
+        before = request.args.get('before')
+
+        unread = 0
+        if before is None and g.user.unread_notifications:
+            unread = Notification.mark_read(g.user.id)
+            db.session.commit()
+
+        notifications, next_cursor = Notification.page(g.user.id, before=before)
+
+        return render_template('users/notifications.html', notifications=notifications,
+                               unread=unread, next_cursor=next_cursor)
+
+
+    @app.route('/notifications/unread-count')
+    def notifications_unread_count():
+        """How many notifications the current user hasn't seen, as JSON."""
+
+        if not g.user:
+            abort(401)
+
+        return jsonify(unread=g.user.unread_notifications)
+
+
     ##############################################################################
     # Messages routes:
 
@@ -317,6 +563,10 @@ def create_app(db_name, testing=False):
         if form.validate_on_submit():
             msg = Message(text=form.text.data)
             g.user.messages.append(msg)
+            db.session.flush()
+            db.session.add_all(MessageTag.for_message(msg))
+            Notification.notify_mentions(msg)
+            live.announce_message(msg)
             db.session.commit()
 
             return redirect(f"/users/{g.user.id}")
@@ -324,6 +574,84 @@ def create_app(db_name, testing=False):
         return render_template('messages/new.html', form=form)
 
 
+    @app.route('/messages/stream')
+    def messages_stream():
+        """Stream new messages from followed users as server-sent events."""
+
+        if not g.user:
+            abort(401)
+
+        headers = {'X-Accel-Buffering': 'no'}
+        user_ids = [user.id for user in g.user.following if user.deleted_at is None]
+
+        live.ensure_listener(app)
+        subscription = live.broker.subscribe(user_ids, limit=app.config['LIVE_MAX_STREAMS'])
+        if subscription is None:
+            return Response(f"retry: {live.BUSY_RETRY_MS}\n\n",
+                            mimetype='text/event-stream', headers=headers)
+
+        # Subscribed first, so nothing posted while this runs is lost.
+        replay = ()
+        last_id = request.headers.get('Last-Event-ID', type=int)
+        if last_id is not None:
+            replay = live.missed_events(user_ids, last_id)
+            if replay is None:
+                live.broker.unsubscribe(subscription)
+                return Response("event: reset\ndata: {}\n\n",
+                                mimetype='text/event-stream', headers=headers)
+
+        return Response(live.event_stream(subscription, replay,
+                                          app.config['LIVE_STREAM_SECONDS']),
+                        mimetype='text/event-stream', headers=headers)
+
+
+    @app.route('/messages/trending')
+    def messages_trending():
+        """Show the messages getting liked fastest right now.
+
+        Reads the precomputed leaderboard; see trending.py.
+        """
+
+        messages = (Message
+                    .query
+                    .join(TrendingMessage, TrendingMessage.message_id == Message.id)
+                    .filter(Message.visible())
+                    .order_by(TrendingMessage.rank)
+                    .options(db.joinedload(Message.user))
+                    .all())
+
+        liked_message_ids = set()
+        if g.user and messages:
+            likes = (Likes.query
+                     .filter(Likes.user_id == g.user.id,
+                             Likes.message_id.in_([msg.id for msg in messages]))
+                     .all())
+            liked_message_ids = {like.message_id for like in likes}
+
+        return render_template('messages/trending.html', messages=messages,
+                               liked_message_ids=liked_message_ids)
+
+
+    @app.route('/tags/<tag>')
+    def tag_timeline(tag):
+        """Show messages using #tag, newest first."""
+
+        messages, next_cursor = MessageTag.timeline(
+            tag, before=request.args.get('before', type=int))
+
+        liked_message_ids = set()
+        if g.user and messages:
+            likes = (Likes.query
+                     .filter(Likes.user_id == g.user.id,
+                             Likes.message_id.in_([msg.id for msg in messages]))
+                     .all())
+            liked_message_ids = {like.message_id for like in likes}
+
+        return render_template('messages/tag.html', tag=markup.normalize_tag(tag),
+                               messages=messages, next_cursor=next_cursor,
+                               liked_message_ids=liked_message_ids)
+
+
     @app.route('/messages/<int:message_id>', methods=["GET", "POST"])
     def messages_show(message_id):
         """Show a message. Also added functionality to like the message in this view."""
@@ -331,7 +659,7 @@ def create_app(db_name, testing=False):
         msg = Message.query.get(message_id)
         like = Likes.query.filter_by(user_id=g.user.id, message_id=message_id).first()
 
-        if msg is None:
+        if msg is None or msg.user.deleted_at:
             abort(404)
         
         if request.method == 'POST':
@@ -360,12 +688,84 @@ def create_app(db_name, testing=False):
             flash('Access unauthorized', 'danger')
             return redirect('/')
         
+        db.session.add(MessageDeletion(message_id=msg.id, user_id=msg.user_id))
         db.session.delete(msg)
         db.session.commit()
 
         return redirect(f"/users/{g.user.id}")
 
 
+    @app.route('/messages/since')
+    def messages_since():
+        """Return what changed in a timeline since the client last looked.
+
+        Takes `after` (the newest message id the client has) and
+        `deleted_after` (the deletion cursor from its last call), plus an
+        optional `user_id` to follow a profile instead of the home timeline.
+        Returns newer messages, oldest first, and the ids deleted since,
+        with the cursors for the next call. At most SINCE_LIMIT messages come
+        back at once; `more` is true if there are others after them, so the
+        client should call again from the new cursor.
+        Leave out `deleted_after` on the first call to just get the current
+        deletion cursor.
+        """
+
+        after = request.args.get('after', 0, type=int)
+        deleted_after = request.args.get('deleted_after', type=int)
+        user_id = request.args.get('user_id', type=int)
+
+        if user_id is not None:
+            author_ids = [user_id]
+        elif g.user:
+            author_ids = (db.select(Follows.user_being_followed_id)
+                          .where(Follows.user_following_id == g.user.id))
+        else:
+            abort(401)
+
+        messages = (db.session
+                    .query(Message.id, Message.text, Message.timestamp,
+                           Message.user_id, User.username, User.image_url)
+                    .join(User, Message.user_id == User.id)
+                    .filter(Message.user_id.in_(author_ids), Message.id > after,
+                            User.deleted_at.is_(None))
+                    .order_by(Message.id)
+                    .limit(SINCE_LIMIT + 1)
+                    .all())
+        more = len(messages) > SINCE_LIMIT
+        messages = messages[:SINCE_LIMIT]
+
+        if deleted_after is None:
+            deleted = []
+            deleted_after = (db.session
+                             .query(func.coalesce(func.max(MessageDeletion.id), 0))
+                             .scalar())
+        else:
+            tombstones = (db.session
+                          .query(MessageDeletion.id, MessageDeletion.message_id)
+                          .filter(MessageDeletion.user_id.in_(author_ids),
+                                  MessageDeletion.id > deleted_after)
+                          .order_by(MessageDeletion.id)
+                          .all())
+            deleted = [t.message_id for t in tombstones]
+            if tombstones:
+                deleted_after = tombstones[-1].id
+
+        return jsonify(
+            messages=[{
+                'id': m.id,
+                'user_id': m.user_id,
+                'username': m.username,
+                'image_url': uploads.thumb(m.image_url, 'sm'),
+                'text': m.text,
+                'date': m.timestamp.strftime('%d %B %Y'),
+            } for m in messages],
+            deleted=deleted,
+            after=messages[-1].id if messages else after,
+            more=more,
+            deleted_after=deleted_after,
+        )
+
+
     ##############################################################################
     # Likes routes:
 
@@ -376,11 +776,13 @@ def create_app(db_name, testing=False):
 
         if like:
             db.session.delete(like)
+            trending.record_like(message_id, -1)
             db.session.commit()
             return False
         else:
             new_like = Likes(user_id=user_id, message_id=message_id)
             db.session.add(new_like)
+            trending.record_like(message_id, 1)
             db.session.commit()
             return True
         
@@ -399,18 +801,32 @@ def create_app(db_name, testing=False):
     @app.route('/users/<int:user_id>/liked-messages')
     def show_liked_messages(user_id):
         """Route user to see what messages they have liked. 
-        Originates from user clicking "Likes" link on any user profile."""
+        Originates from user clicking "Likes" link on any user profile.
+
+        Paged by like, newest first. With ?stream=1 every like is rendered
+        in one response instead, streamed out as rows come off a
+        server-side cursor rather than built up in memory first.
+        """
 
         if not g.user:
             flash('Access unauthorized.', 'danger')
-            return('/')
-        
-        user = User.query.get_or_404(user_id)
+            return redirect('/')
         
-        liked_messages = Message.query.join(Likes).filter(Likes.user_id == user_id).order_by(Message.timestamp.desc()).all()
-        likes_count = len(user.likes)
+        user = get_user_or_404(user_id)
+        likes_count = Likes.query.filter_by(user_id=user_id).count()
+
+        if request.args.get('stream'):
+            rows = user.liked_messages().yield_per(LIKES_PER_PAGE)
+            liked_messages = (message for message, like_id in rows)
+            page = stream_template('/messages/liked-messages.html', user=user,
+                                   liked_messages=liked_messages, likes_count=likes_count)
+            return Response(buffered(page), mimetype='text/html')
 
-        return render_template('/messages/liked-messages.html', user=user, liked_messages=liked_messages, likes_count=likes_count)
+        liked_messages, next_cursor = user.liked_messages_page(
+            before=request.args.get('before', type=int))
+
+        return render_template('/messages/liked-messages.html', user=user, liked_messages=liked_messages,
+                               likes_count=likes_count, next_cursor=next_cursor)
 
     ##############################################################################
     # Homepage and error pages
@@ -426,16 +842,13 @@ def create_app(db_name, testing=False):
 
         if g.user:
             following_ids = [user.id for user in g.user.following]
-            messages = (Message
-                        .query
-                        .filter(Message.user_id.in_(following_ids))
-                        .order_by(Message.timestamp.desc())
-                        .limit(100)
-                        .all())
+            messages = Message.newest(
+                Message.query.filter(Message.user_id.in_(following_ids), Message.visible()), 100)
             likes = (Likes.query.filter(Likes.user_id == g.user.id).all())
             liked_message_ids = {like.message_id for like in likes}
 
-            return render_template('home.html', messages=messages, likes=likes, liked_message_ids=liked_message_ids)
+            return render_template('home.html', messages=messages, likes=likes, liked_message_ids=liked_message_ids,
+                                   suggested_users=suggestions.suggestions_for(g.user))
 
         else:
             return render_template('home-anon.html')
@@ -450,7 +863,17 @@ def create_app(db_name, testing=False):
 
     @app.after_request
     def add_header(req):
-        """Add non-caching headers on every request."""
+        """Add non-caching headers on every request.
+
+        Fingerprinted files are marked immutable and keep their headers.
+        """
+
+        if 'immutable' in req.headers.get('Cache-Control', ''):
+            return req
+
+        if req.mimetype == 'text/event-stream':
+            req.headers['Cache-Control'] = 'no-cache'
+            return req
 
         req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
         req.headers["Pragma"] = "no-cache"
@@ -0,0 +1,239 @@
+"""Async read path for Warbler, served by an ASGI server:
+
+    hypercorn asgi:app
+
+This serves the home timeline, profile and liked-messages pages from the same
+models and templates as the WSGI app, on SQLAlchemy's async engine. A slow
+query only parks a coroutine instead of a whole worker, and the queries for a
+page run concurrently, each on its own connection. Quart reads the same signed
+session cookie as Flask, so users stay logged in across both apps.
+
+Everything that writes still goes through the WSGI app in `app.py`.
+"""
+
+import asyncio
+import os
+from datetime import datetime
+
+from dotenv import load_dotenv
+from quart import Quart, render_template, redirect, flash, request, session, g, abort
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import selectinload
+
+import snowflake
+from app import CURR_USER_KEY, add_template_helpers
+from models import LIKES_PER_PAGE, RECENT_MESSAGES, User, Message, Likes, Follows
+
+load_dotenv()
+
+
+def async_database_uri(uri):
+    """Point a postgresql:// URI, with or without a driver, at asyncpg."""
+
+    for scheme in ('postgresql://', 'postgres://'):
+        if uri.startswith(scheme):
+            return 'postgresql+asyncpg://' + uri[len(scheme):]
+    if uri.startswith('postgresql+'):
+        return 'postgresql+asyncpg://' + uri.split('://', 1)[1]
+    return uri
+
+
+def create_async_app(db_name):
+    app = Quart(__name__)
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = async_database_uri(
+        os.environ.get('DATABASE_URL', f'postgresql:///{db_name}'))
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
+    app.config['ASSETS_DIST'] = os.path.join(app.static_folder, 'dist')
+
+    add_template_helpers(app)
+
+    engine = create_async_engine(
+        app.config['SQLALCHEMY_DATABASE_URI'],
+        pool_size=int(os.environ.get('ASYNC_POOL_SIZE', 20)),
+    )
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def fetch(stmt, scalar=False, rows=False):
+        """Run `stmt` on its own connection.
+
+        Returns the first column of every row, or with `scalar` one value,
+        or with `rows` the whole rows.
+        """
+
+        async with Session() as db_session:
+            result = await db_session.execute(stmt)
+            if scalar:
+                return result.scalar()
+            if rows:
+                return result.all()
+            return result.scalars().all()
+
+    async def fetch_newest(stmt, limit):
+        """The newest `limit` messages from `stmt`; see Message.newest."""
+
+        floor = snowflake.first_id_at(datetime.utcnow() - RECENT_MESSAGES)
+        stmt = stmt.order_by(Message.id.desc())
+        messages = await fetch(stmt.where(Message.id >= floor).limit(limit))
+
+        if len(messages) < limit:
+            messages += await fetch(stmt.where(Message.id < floor).limit(limit - len(messages)))
+
+        return messages
+
+    @app.after_serving
+    async def dispose_engine():
+        await engine.dispose()
+
+
+    ##############################################################################
+    # User in session
+
+
+    @app.before_request
+    async def add_user_to_g():
+        """If we're logged in, add curr user to Quart global."""
+
+        g.user = None
+
+        if CURR_USER_KEY in session:
+            users = await fetch(select(User).where(User.id == session[CURR_USER_KEY],
+                                                   User.deleted_at.is_(None)))
+            g.user = users[0] if users else None
+
+
+    async def get_user_or_404(user_id):
+        users = await fetch(select(User).where(User.id == user_id, User.deleted_at.is_(None)))
+        if not users:
+            abort(404)
+        return users[0]
+
+
+    async def counts_of(user_id):
+        """(messages, following, followers) counts, for User.use_counts."""
+
+        [counts] = await fetch(User.counts(user_id), rows=True)
+        return counts
+
+
+    async def following_among(user_ids):
+        """Which of `user_ids` the logged in user follows, for User.use_following."""
+
+        if not g.user:
+            return set()
+        return set(await fetch(select(Follows.user_being_followed_id)
+                               .where(Follows.user_following_id == g.user.id,
+                                      Follows.user_being_followed_id.in_(user_ids))))
+
+
+    def liked_message_ids_of(user_id):
+        return fetch(select(Likes.message_id).where(Likes.user_id == user_id))
+
+
+    def likes_count_of(user_id):
+        return fetch(
+            select(func.count()).select_from(Likes).where(Likes.user_id == user_id),
+            scalar=True)
+
+
+    ##############################################################################
+    # Read-only pages
+
+
+    @app.route('/users/<int:user_id>')
+    async def users_show(user_id):
+        """Show user profile."""
+
+        user, counts, messages, liked_message_ids, likes_count, following = await asyncio.gather(
+            get_user_or_404(user_id),
+            counts_of(user_id),
+            fetch_newest(select(Message).where(Message.user_id == user_id), 100),
+            liked_message_ids_of(user_id),
+            likes_count_of(user_id),
+            following_among([user_id]),
+        )
+        user.use_counts(*counts)
+        if g.user:
+            g.user.use_following([user_id], following)
+
+        return await render_template(
+            'users/show.html', user=user, messages=messages,
+            location=user.location, bio=user.bio,
+            header_image_url=user.header_image_url, likes_count=likes_count,
+            liked_message_ids=set(liked_message_ids))
+
+
+    @app.route('/users/<int:user_id>/liked-messages')
+    async def show_liked_messages(user_id):
+        """Show the messages this user has liked, a page at a time.
+
+        Paged by like id, newest first, like User.liked_messages_page.
+        """
+
+        if not g.user:
+            await flash('Access unauthorized.', 'danger')
+            return redirect('/')
+
+        stmt = (select(Message, Likes.id)
+                .join(Likes, Likes.message_id == Message.id)
+                .where(Likes.user_id == user_id)
+                .order_by(Likes.id.desc())
+                .limit(LIKES_PER_PAGE + 1)
+                .options(selectinload(Message.user)))
+
+        before = request.args.get('before', type=int)
+        if before is not None:
+            stmt = stmt.where(Likes.id < before)
+
+        user, counts, rows, likes_count, following = await asyncio.gather(
+            get_user_or_404(user_id),
+            counts_of(user_id),
+            fetch(stmt, rows=True),
+            likes_count_of(user_id),
+            following_among([user_id]),
+        )
+        user.use_counts(*counts)
+        g.user.use_following([user_id], following)
+
+        next_cursor = None
+        if len(rows) > LIKES_PER_PAGE:
+            next_cursor = rows[LIKES_PER_PAGE - 1][1]
+
+        return await render_template(
+            '/messages/liked-messages.html', user=user,
+            liked_messages=[message for message, like_id in rows[:LIKES_PER_PAGE]],
+            likes_count=likes_count, next_cursor=next_cursor)
+
+
+    @app.route('/')
+    async def homepage():
+        """Show homepage:
+
+        - anon users: no messages
+        - logged in: 100 most recent messages of followed_users
+        """
+
+        if not g.user:
+            return await render_template('home-anon.html')
+
+        following_ids = (select(Follows.user_being_followed_id)
+                         .where(Follows.user_following_id == g.user.id))
+
+        counts, messages, liked_message_ids = await asyncio.gather(
+            counts_of(g.user.id),
+            fetch_newest(select(Message)
+                         .where(Message.user_id.in_(following_ids), Message.visible())
+                         .options(selectinload(Message.user)), 100),
+            liked_message_ids_of(g.user.id),
+        )
+        g.user.use_counts(*counts)
+
+        return await render_template(
+            'home.html', messages=messages,
+            liked_message_ids=set(liked_message_ids))
+
+    return app
+
+
+app = create_async_app('warbler')
@@ -0,0 +1,292 @@
+"""Self-hosted, fingerprinted static assets.
+
+Third-party files are pinned in VENDOR, each with its upstream URL and its
+Subresource Integrity hash, and committed under static/vendor/. `flask
+assets build` checks every vendor file against its hash and never touches
+the network; it fails if a pinned file is missing or doesn't match. It then
+takes everything under static/, minifies the
+CSS, renames each file after a hash of its contents, rewrites the url()s
+inside stylesheets to match, and writes the results, plus gzip and brotli
+versions, to static/dist/ with a manifest.
+
+Templates link to files with `asset_url('stylesheets/style.css')`. Built
+files are served from /assets/ with far-future immutable caching, since any
+change gets a new name. Pages never load anything from a CDN: `flask assets
+fetch` downloads a pinned file that isn't committed yet and checks it against
+its pin before writing it, ready to commit.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import urllib.request
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+FONTAWESOME = 'https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.5.2'
+
+# static/ path -> (pinned upstream URL, SRI hash)
+VENDOR = {
+    'vendor/bootstrap/bootstrap.min.css': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@4.6.2/dist/css/bootstrap.min.css',
+        'sha384-xOolHFLEh07PJGoPkLv1IbcEPTNtaed2xpHsD9ESMhqIYd0nLMwNLD69Npy4HI+N'),
+    'vendor/bootstrap/bootstrap.min.js': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@4.6.2/dist/js/bootstrap.min.js',
+        'sha384-+sLIOodYLS7CIrQpBjl+C7nPvqq+FbNUBDunl/OZv93DB7Ln/533i8e/mZXLi/P+'),
+    'vendor/jquery/jquery.min.js': (
+        'https://cdn.jsdelivr.net/npm/jquery@3.7.1/dist/jquery.min.js',
+        'sha384-1H217gwSVyLSIfaLxHbE7dRb3v4mYCKbpQvzx0cegeju1MVsGrX5xXxAvs/HgeFs'),
+    'vendor/popper/popper.min.js': (
+        'https://cdn.jsdelivr.net/npm/popper.js@1.16.1/dist/umd/popper.min.js',
+        'sha384-9/reFTGAW83EW2RDu2S0VKaIzap3H66lZH81PoYlFhbGU+6BZp6G7niu735Sk7lN'),
+    'vendor/fontawesome/css/all.min.css': (
+        f'{FONTAWESOME}/css/all.min.css',
+        'sha384-O/sskpbLDdQKmS/h12s1zvFz2FJYw3z+xkZCAAzaKwpe44o5iGZSINtjwfcA7xT0'),
+    'vendor/fontawesome/webfonts/fa-brands-400.ttf': (
+        f'{FONTAWESOME}/webfonts/fa-brands-400.ttf',
+        'sha384-/HC6XAmihR23AITXoC+eErLQOmOPxEQhr3+y0RLQADeFdVNk/PcgopQYCyUWQFVN'),
+    'vendor/fontawesome/webfonts/fa-brands-400.woff2': (
+        f'{FONTAWESOME}/webfonts/fa-brands-400.woff2',
+        'sha384-F7+sP+FYQZ/K54EL4XJ3QEIIsvhxo8DGaDNYAiKjvZ6UuoD/3NKpnmu2teD6yNox'),
+    'vendor/fontawesome/webfonts/fa-regular-400.ttf': (
+        f'{FONTAWESOME}/webfonts/fa-regular-400.ttf',
+        'sha384-KcC2mhu70gyL+EFVIGLUMdEgodqttlAzyTVv3exvWN30rRuE37e3/rEzJmCA90/5'),
+    'vendor/fontawesome/webfonts/fa-regular-400.woff2': (
+        f'{FONTAWESOME}/webfonts/fa-regular-400.woff2',
+        'sha384-zjzkD/f/AiDmIjwMSJkzaQUW+eDxqWx7XzAu/614xFagzRIAkBIZ4Oe1fDnKVnQa'),
+    'vendor/fontawesome/webfonts/fa-solid-900.ttf': (
+        f'{FONTAWESOME}/webfonts/fa-solid-900.ttf',
+        'sha384-HiGo4G5Bo6ggyotlWhi7GrzwzrlBSmE0Mv14lOYdo4x5c/SRdodgkPtysbOp7m0i'),
+    'vendor/fontawesome/webfonts/fa-solid-900.woff2': (
+        f'{FONTAWESOME}/webfonts/fa-solid-900.woff2',
+        'sha384-/yPfwhDVE7kxMpMWSRkPuIptMPApLQTfaUaYRIdQExK4Nglm9fFgbaQZWq5HdhhV'),
+    'vendor/fontawesome/webfonts/fa-v4compatibility.ttf': (
+        f'{FONTAWESOME}/webfonts/fa-v4compatibility.ttf',
+        'sha384-BdZIKVaC2/RxrgjeiIcHRTnWqrsabjfkFauwjqviPt5A/rmKH3/9m/xXzKsnHBkj'),
+    'vendor/fontawesome/webfonts/fa-v4compatibility.woff2': (
+        f'{FONTAWESOME}/webfonts/fa-v4compatibility.woff2',
+        'sha384-gv2r1DagmY6lqBzuRPtlmlz2OghgYpVOyJ0mStTwtLOhU7ak5x97480YhVDLbrV9'),
+}
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.ico', '.ttf', '.eot', '.json'}
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def integrity(content):
+    """The SRI hash of `content`."""
+
+    return 'sha384-' + base64.b64encode(hashlib.sha384(content).digest()).decode('ascii')
+
+
+def verify_vendor(static_dir):
+    """Check committed vendor files against their pins.
+
+    Raises ValueError for a file that doesn't match. Returns the pinned
+    paths that aren't committed.
+    """
+
+    missing = []
+    for path, (url, pinned) in VENDOR.items():
+        full = os.path.join(static_dir, path)
+        if not os.path.exists(full):
+            missing.append(path)
+            continue
+        with open(full, 'rb') as f:
+            if integrity(f.read()) != pinned:
+                raise ValueError(f"{path} doesn't match its pinned hash")
+    return missing
+
+
+def fetch_vendor(static_dir):
+    """Download pinned vendor files that aren't committed yet.
+
+    Each download is checked against its pin before it's written.
+    """
+
+    for path in verify_vendor(static_dir):
+        url, pinned = VENDOR[path]
+        with urllib.request.urlopen(url) as resp:
+            content = resp.read()
+        if integrity(content) != pinned:
+            raise ValueError(f"{url} doesn't match its pinned hash")
+
+        dest = os.path.join(static_dir, path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, 'wb') as f:
+            f.write(content)
+
+
+def minify_css(css):
+    """Strip comments and the whitespace around punctuation."""
+
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def _hashed_name(path, content):
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def _rewrite_css_urls(css, css_path, manifest):
+    """Point url()s in a stylesheet at the hashed copies of their files."""
+
+    def replace(match):
+        # Keep any ?query or #fragment, as in the font-face rules
+        url, suffix = re.match(r'([^?#]*)(.*)', match.group(2)).groups()
+
+        if url.startswith('/static/'):
+            path = url[len('/static/'):]
+        elif not url or ':' in url or url.startswith('/'):
+            return match.group(0)
+        else:
+            path = posixpath.normpath(posixpath.join(posixpath.dirname(css_path), url))
+
+        if path not in manifest:
+            return match.group(0)
+        return f'url("/assets/{manifest[path]}{suffix}")'
+
+    return CSS_URL.sub(replace, css)
+
+
+def _write(dist_dir, name, content):
+    dest = os.path.join(dist_dir, name)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with open(dest, 'wb') as f:
+        f.write(content)
+
+    if posixpath.splitext(name)[1] in COMPRESSIBLE:
+        compressed = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli:
+            compressed['.br'] = brotli.compress(content, quality=11)
+        for suffix, data in compressed.items():
+            if len(data) < len(content):
+                with open(dest + suffix, 'wb') as f:
+                    f.write(data)
+
+
+def build(static_dir, dist_dir):
+    """Fingerprint everything in `static_dir` into `dist_dir`.
+
+    Returns the manifest of static path -> hashed path.
+    """
+
+    dist_dir = os.path.abspath(dist_dir)
+    sources = []
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != dist_dir]
+        for filename in files:
+            full = os.path.join(root, filename)
+            sources.append(os.path.relpath(full, static_dir).replace(os.sep, '/'))
+
+    manifest = {}
+
+    # Stylesheets go last, so the files they point at already have names.
+    for path in sorted(sources, key=lambda p: p.endswith('.css')):
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            content = f.read()
+
+        if path.endswith('.css'):
+            css = _rewrite_css_urls(content.decode('utf-8'), path, manifest)
+            content = minify_css(css).encode('utf-8')
+
+        manifest[path] = _hashed_name(path, content)
+        _write(dist_dir, manifest[path], content)
+
+    _write(dist_dir, 'manifest.json', json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+
+def _manifest(app):
+    extensions = app.extensions
+    if 'assets' not in extensions:
+        try:
+            with open(os.path.join(app.config['ASSETS_DIST'], 'manifest.json')) as f:
+                extensions['assets'] = json.load(f)
+        except FileNotFoundError:
+            extensions['assets'] = {}
+    return extensions['assets']
+
+
+def asset_url(path, app=None):
+    """URL for the static file at `path`, fingerprinted if it's been built.
+
+    `app` defaults to the current Flask app; asgi.py passes its Quart app.
+    """
+
+    app = app or current_app
+    manifest = _manifest(app)
+    if path in manifest:
+        return f"/assets/{manifest[path]}"
+    return f"/static/{path}"
+
+
+def send_asset(filename):
+    """Serve a built file, precompressed if the client accepts it."""
+
+    dist_dir = current_app.config['ASSETS_DIST']
+    response = None
+
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(
+                os.path.join(dist_dir, filename + suffix)):
+            response = send_from_directory(
+                dist_dir, filename + suffix,
+                mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+            response.headers['Content-Encoding'] = encoding
+            break
+
+    if response is None:
+        response = send_from_directory(dist_dir, filename)
+
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+cli = AppGroup('assets', help="Build static assets.")
+
+
+@cli.command('fetch')
+def fetch_command():
+    """Download pinned vendor files that aren't committed yet."""
+
+    try:
+        fetch_vendor(current_app.static_folder)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo("Fetched vendor files; commit them under static/vendor/.")
+
+
+@cli.command('build')
+def build_command():
+    """Fingerprint and compress static files into static/dist/."""
+
+    try:
+        missing = verify_vendor(current_app.static_folder)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if missing:
+        raise click.ClickException(
+            "Pinned vendor files aren't committed: " + ', '.join(missing)
+            + ". Run `flask assets fetch` and commit them.")
+
+    manifest = build(current_app.static_folder, current_app.config['ASSETS_DIST'])
+    click.echo(f"Built {len(manifest)} assets.")
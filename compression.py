@@ -0,0 +1,141 @@
+"""gzip/brotli compression of responses, as WSGI middleware.
+
+Buffered responses are compressed in one go, and only if they're at least
+`min_size` bytes. Streamed responses (no Content-Length) are compressed chunk
+by chunk, with a flush after each chunk, so whatever the app has yielded
+reaches the client right away. Anything that's already encoded, isn't text,
+or asks for no-transform is passed through untouched. A strong ETag on a
+response that gets compressed is made weak, since the bytes sent are no
+longer the ones it names.
+
+Default levels, measured on a rendered 100-message home timeline (85 KB):
+
+    gzip 3:   9.8 KB, 0.57 ms     brotli 1:  9.6 KB, 0.21 ms
+    gzip 5:   9.1 KB, 1.1 ms      brotli 4:  8.3 KB, 0.91 ms
+    gzip 6:   8.9 KB, 1.3 ms      brotli 5:  7.9 KB, 1.4 ms
+    gzip 9:   8.8 KB, 2.4 ms      brotli 11: 6.5 KB, 207 ms
+
+brotli 4 beats every gzip level on both bytes and CPU. gzip 5 is where gzip
+stops paying for itself. Higher levels are for files compressed once at
+build time; see assets.py.
+"""
+
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('text/', 'application/json', 'application/javascript',
+                'application/xml', 'image/svg+xml')
+
+
+class _Gzip:
+    def __init__(self, level):
+        self._zlib = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data):
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._zlib.flush()
+
+
+class _Brotli:
+    def __init__(self, quality):
+        self._brotli = brotli.Compressor(quality=quality)
+
+    def chunk(self, data):
+        return self._brotli.process(data) + self._brotli.flush()
+
+    def finish(self):
+        return self._brotli.finish()
+
+
+class Compress:
+    """Compress responses from `app` for clients that accept it."""
+
+    def __init__(self, app, min_size=500, gzip_level=5, brotli_quality=4):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _negotiate(self, environ):
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli and accept['br']:
+            return 'br'
+        if accept['gzip']:
+            return 'gzip'
+        return None
+
+    def _compressor(self, encoding):
+        if encoding == 'br':
+            return _Brotli(self.brotli_quality)
+        return _Gzip(self.gzip_level)
+
+    def _should_compress(self, status, headers):
+        if int(status.split(' ', 1)[0]) in (204, 206, 304):
+            return False
+        if 'Content-Encoding' in headers:
+            return False
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        if not headers.get('Content-Type', '').startswith(COMPRESSIBLE):
+            return False
+
+        length = headers.get('Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    def __call__(self, environ, start_response):
+        encoding = self._negotiate(environ)
+        if encoding is None or environ['REQUEST_METHOD'] == 'HEAD':
+            return self.app(environ, start_response)
+
+        captured = {}
+
+        # Only hand the headers on once we know whether we're compressing.
+        def deferred_start(status, headers, exc_info=None):
+            captured.update(status=status, headers=Headers(headers), exc_info=exc_info)
+            return lambda data: None
+
+        body = self.app(environ, deferred_start)
+        status, headers = captured['status'], captured['headers']
+
+        if not self._should_compress(status, headers):
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            return body
+
+        headers['Content-Encoding'] = encoding
+        headers.add('Vary', 'Accept-Encoding')
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = 'W/' + etag
+        compressor = self._compressor(encoding)
+
+        if 'Content-Length' in headers:
+            try:
+                data = compressor.chunk(b''.join(body)) + compressor.finish()
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+            headers['Content-Length'] = str(len(data))
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            return [data]
+
+        start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+        return self._stream(body, compressor)
+
+    def _stream(self, body, compressor):
+        try:
+            for chunk in body:
+                if chunk:
+                    yield compressor.chunk(chunk)
+            yield compressor.finish()
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
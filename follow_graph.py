@@ -0,0 +1,307 @@
+"""Compact, shared index of the follow graph.
+
+The graph is stored CSR-style in one memory-mapped file: for each user id, a
+sorted slice of the ids they follow (and another of the ids following them),
+with offsets into those arrays. Every worker maps the same file, so the OS
+keeps a single copy in memory. "Does A follow B" is a binary search in A's
+slice, and a follower count is the difference of two offsets.
+
+Follows and unfollows made after the file was built are appended to a small
+delta log next to it, once their transaction commits. Each worker replays new
+deltas into an in-memory overlay before answering. `flask graph build`
+rebuilds the file from the `follows` table.
+
+The index mirrors `follows` exactly, so a deleted account's follows still
+count until the purge removes them (accounts.py deletes follows first, one
+UNFOLLOW delta per edge). The follower and following pages hide deleted
+accounts at once, so for that short while a count can be higher than the
+page shows.
+"""
+
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+
+import click
+import numpy as np
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+
+MAGIC = b'WFG1'
+
+# magic, user id space, edges, delta log offset the file already includes
+HEADER = struct.Struct('<4s4xqqq')
+
+# op, follower id, followed id
+DELTA = struct.Struct('<iii')
+
+FOLLOW, UNFOLLOW = 1, -1
+
+# Seconds between checks for a rebuilt file or other workers' deltas.
+RECHECK = 0.05
+
+
+class FollowGraph:
+    """Read-only view of a built graph file plus replayed deltas."""
+
+    def __init__(self, path):
+        self.path = path
+        self.delta_path = path + '.delta'
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        stat = os.stat(self.path)
+        self._version = (stat.st_ino, stat.st_mtime_ns)
+        self._checked = time.monotonic()
+
+        raw = np.memmap(self.path, dtype=np.uint8, mode='r')
+        magic, nodes, edges, delta_start = HEADER.unpack(raw[:HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a follow graph")
+
+        offset = HEADER.size
+
+        def array(dtype, count):
+            nonlocal offset
+            size = count * np.dtype(dtype).itemsize
+            arr = raw[offset:offset + size].view(dtype)
+            offset += _padded(size)
+            return arr
+
+        self._nodes = nodes
+        self._out_offsets = array(np.int64, nodes + 1)
+        self._out_targets = array(np.int32, edges)
+        self._in_offsets = array(np.int64, nodes + 1)
+        self._in_targets = array(np.int32, edges)
+
+        self._delta_pos = delta_start
+        self._added = set()
+        self._removed = set()
+        self._out_adjust = defaultdict(int)
+        self._in_adjust = defaultdict(int)
+
+    def _refresh(self, force=False):
+        """Pick up a rebuilt file and any new deltas."""
+
+        now = time.monotonic()
+        if not force and now - self._checked < RECHECK:
+            return
+        self._checked = now
+
+        stat = os.stat(self.path)
+        if (stat.st_ino, stat.st_mtime_ns) != self._version:
+            self._load()
+
+        try:
+            size = os.path.getsize(self.delta_path)
+        except FileNotFoundError:
+            return
+
+        if size > self._delta_pos:
+            with open(self.delta_path, 'rb') as f:
+                f.seek(self._delta_pos)
+                data = f.read(size - self._delta_pos)
+            data = data[:len(data) - len(data) % DELTA.size]
+            for op, follower, followed in DELTA.iter_unpack(data):
+                self._apply(op, follower, followed)
+            self._delta_pos += len(data)
+
+    def _apply(self, op, follower, followed):
+        """Replay one delta. Replaying a delta twice is harmless."""
+
+        edge = (follower, followed)
+        in_base = self._base_follows(follower, followed)
+        change = 0
+
+        if op == FOLLOW:
+            if edge in self._removed:
+                self._removed.discard(edge)
+                change = 1
+            elif not in_base and edge not in self._added:
+                self._added.add(edge)
+                change = 1
+        else:
+            if edge in self._added:
+                self._added.discard(edge)
+                change = -1
+            elif in_base and edge not in self._removed:
+                self._removed.add(edge)
+                change = -1
+
+        self._out_adjust[follower] += change
+        self._in_adjust[followed] += change
+
+    def _slice(self, offsets, targets, user_id):
+        if user_id >= self._nodes:
+            return targets[:0]
+        return targets[offsets[user_id]:offsets[user_id + 1]]
+
+    def _base_follows(self, follower, followed):
+        targets = self._slice(self._out_offsets, self._out_targets, follower)
+        i = targets.searchsorted(followed)
+        return i < len(targets) and targets[i] == followed
+
+    def _count(self, offsets, adjust, user_id):
+        base = 0
+        if user_id < self._nodes:
+            base = int(offsets[user_id + 1] - offsets[user_id])
+        return base + adjust.get(user_id, 0)
+
+    def follows(self, follower, followed):
+        """Does `follower` follow `followed`?"""
+
+        with self._lock:
+            self._refresh()
+            edge = (follower, followed)
+            if edge in self._added:
+                return True
+            if edge in self._removed:
+                return False
+            return bool(self._base_follows(follower, followed))
+
+    def is_mutual(self, a, b):
+        """Do `a` and `b` follow each other?"""
+
+        return self.follows(a, b) and self.follows(b, a)
+
+    def following(self, user_id):
+        """Sorted array of the ids `user_id` follows."""
+
+        with self._lock:
+            self._refresh()
+            ids = self._slice(self._out_offsets, self._out_targets, user_id)
+            added = [b for (a, b) in self._added if a == user_id]
+            removed = [b for (a, b) in self._removed if a == user_id]
+
+        if added or removed:
+            ids = np.union1d(np.setdiff1d(ids, removed, assume_unique=True), added)
+        return ids
+
+    def common_following(self, a, b):
+        """Sorted array of the ids both `a` and `b` follow."""
+
+        return np.intersect1d(self.following(a), self.following(b), assume_unique=True)
+
+    def followers_count(self, user_id):
+        with self._lock:
+            self._refresh()
+            return self._count(self._in_offsets, self._in_adjust, user_id)
+
+    def following_count(self, user_id):
+        with self._lock:
+            self._refresh()
+            return self._count(self._out_offsets, self._out_adjust, user_id)
+
+
+def _padded(size):
+    return size + (-size % 8)
+
+
+def build(path, connection):
+    """Write a fresh graph file for `path` from the follows table."""
+
+    delta_path = path + '.delta'
+    # Everything logged before this point is in the snapshot we read next;
+    # deltas logged after it are replayed, harmlessly, on top.
+    delta_start = os.path.getsize(delta_path) if os.path.exists(delta_path) else 0
+    delta_start -= delta_start % DELTA.size
+
+    nodes = connection.execute(text("SELECT coalesce(max(id), 0) + 1 FROM users")).scalar()
+    rows = connection.execute(
+        text("SELECT user_following_id, user_being_followed_id FROM follows")).fetchall()
+    edges = np.array(rows, dtype=np.int32).reshape(-1, 2)
+
+    # The two reads are separate snapshots: a user who signed up and
+    # followed someone in between must still get a slot.
+    if len(edges):
+        nodes = max(nodes, int(edges.max()) + 1)
+
+    sections = []
+    for key, target in ((0, 1), (1, 0)):
+        ordered = edges[np.lexsort((edges[:, target], edges[:, key]))]
+        offsets = np.zeros(nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ordered[:, key], minlength=nodes), out=offsets[1:])
+        sections += [offsets, np.ascontiguousarray(ordered[:, target])]
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, nodes, len(edges), delta_start))
+        for section in sections:
+            data = section.tobytes()
+            f.write(data + b'\0' * (_padded(len(data)) - len(data)))
+    os.replace(tmp_path, path)
+
+
+def append_deltas(path, deltas):
+    """Append (op, follower, followed) deltas to the log for `path`."""
+
+    data = b''.join(DELTA.pack(*delta) for delta in deltas)
+    fd = os.open(path + '.delta', os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def get_index():
+    """This worker's graph index, or None if none has been built."""
+
+    if not has_app_context():
+        return None
+
+    extensions = current_app.extensions
+    if 'follow_graph' not in extensions:
+        path = current_app.config.get('FOLLOW_GRAPH_PATH')
+        extensions['follow_graph'] = (
+            FollowGraph(path) if path and os.path.exists(path) else None)
+
+    return extensions['follow_graph']
+
+
+def record(session, op, follower_id, followed_id):
+    """Log a follow change once `session` commits."""
+
+    session.info.setdefault('follow_graph_deltas', []).append(
+        (op, follower_id, followed_id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _log_committed_deltas(session):
+    deltas = session.info.pop('follow_graph_deltas', None)
+    if not deltas or not has_app_context():
+        return
+
+    path = current_app.config.get('FOLLOW_GRAPH_PATH')
+    if path and os.path.exists(path):
+        append_deltas(path, deltas)
+        index = current_app.extensions.get('follow_graph')
+        if index:
+            with index._lock:
+                index._refresh(force=True)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_rolled_back_deltas(session):
+    session.info.pop('follow_graph_deltas', None)
+
+
+cli = AppGroup('graph', help="Maintain the follow graph index.")
+
+
+@cli.command('build')
+def build_command():
+    """Rebuild the follow graph index from the database."""
+
+    from models import db
+
+    path = current_app.config['FOLLOW_GRAPH_PATH']
+    with db.engine.connect() as connection:
+        build(path, connection)
+    click.echo(f"Built follow graph at {path}.")
@@ -1,7 +1,10 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileAllowed, FileField
 from wtforms import StringField, PasswordField, TextAreaField
 from wtforms.validators import DataRequired, Email, Length
 
+IMAGE_TYPES = FileAllowed(['jpg', 'jpeg', 'png', 'gif', 'webp'], 'Images only.')
+
 
 class MessageForm(FlaskForm):
     """Form for adding/editing messages."""
@@ -16,6 +19,7 @@ class UserAddForm(FlaskForm):
     email = StringField('E-mail', validators=[DataRequired(), Email()])
     password = PasswordField('Password', validators=[Length(min=6)])
     image_url = StringField('(Optional) Image URL')
+    image_file = FileField('(Optional) Upload an image', validators=[IMAGE_TYPES])
 
 
 class LoginForm(FlaskForm):
@@ -30,7 +34,9 @@ class EditProfileForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
     email = StringField('E-mail', validators=[DataRequired(), Email()])
     image_url = StringField('(Optional) Image URL')
+    image_file = FileField('(Optional) Upload an image', validators=[IMAGE_TYPES])
     header_image_url = StringField('(Optional) Header Image URL')
+    header_image_file = FileField('(Optional) Upload a header image', validators=[IMAGE_TYPES])
     bio = StringField('(Optional) Bio')
     password = PasswordField('Password', validators=[Length(min=6)])
 
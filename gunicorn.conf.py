@@ -0,0 +1,66 @@
+"""Gunicorn settings for Warbler.
+
+gunicorn picks this file up automatically: `gunicorn server:app`.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Workers write metrics here and /metrics sums them; see metrics.py. This
+# has to be set before the app (and prometheus_client) is imported.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                      os.path.join(tempfile.gettempdir(), 'warbler-metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+# Import the app once in the master; workers fork with it already loaded.
+preload_app = True
+
+# Threaded workers, so open live-update streams (/messages/stream) don't each
+# take a whole worker. Each stream still holds a thread, so a worker serves
+# at most LIVE_MAX_STREAMS (default 4) of them, leaving the rest of its
+# threads for pages, and each stream ends after LIVE_STREAM_SECONDS for the
+# browser to reconnect. Raise LIVE_MAX_STREAMS together with this.
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+
+def on_starting(server):
+    """Start with no metrics left over from a previous run.
+
+    This runs after the preloaded import, so it also drops the master's
+    own files; workers make fresh ones when they first record.
+    """
+
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def pre_fork(server, worker):
+    """Note when this worker started, so we can report its cold start."""
+
+    worker.fork_started = time.perf_counter()
+
+
+def post_fork(server, worker):
+    """Drop any database connections inherited from the master."""
+
+    if 'server' in sys.modules:
+        from models import dispose_engine
+        dispose_engine(sys.modules['server'].app)
+
+
+def post_worker_init(worker):
+    """Log how long this worker took from fork to ready to serve."""
+
+    elapsed = (time.perf_counter() - worker.fork_started) * 1000
+    worker.log.info("Worker %s cold start: %.1f ms", worker.pid, elapsed)
+
+
+def child_exit(server, worker):
+    """Stop counting a dead worker's live gauges."""
+
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,152 @@
+"""Durable background jobs, stored in PostgreSQL.
+
+Register a handler with `@job`, and queue work from a request with
+`enqueue`. The job row is written in the request's own transaction, so it
+only becomes visible to workers if the request commits.
+
+Workers (`flask jobs work`) claim due jobs with `FOR UPDATE SKIP LOCKED`, so
+any number of them can share the table without blocking each other. A
+handler runs inside the claiming transaction: its database changes and the
+removal of the job commit together, so each job takes effect exactly once. If
+the handler raises, its changes are rolled back to a savepoint and the job is
+retried later with backoff, until it runs out of attempts and is marked
+`failed`. Handlers must not commit.
+"""
+
+import signal
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, utc_now, Job
+
+handlers = {}
+
+
+def job(kind=None, max_attempts=5):
+    """Register the decorated function as the handler for `kind` jobs."""
+
+    def register(fn):
+        fn.max_attempts = max_attempts
+        handlers[kind or fn.__name__] = fn
+        return fn
+
+    return register
+
+
+def enqueue(kind, dedupe_key=None, run_at=None, **payload):
+    """Queue a `kind` job in the current transaction.
+
+    `run_at` is a naive UTC datetime, like datetime.utcnow(); by default
+    the job is due now. If `dedupe_key` is given and a pending job already
+    has it, nothing is queued.
+    """
+
+    stmt = insert(Job).values(
+        kind=kind,
+        payload=payload,
+        dedupe_key=dedupe_key,
+        status='pending',
+        attempts=0,
+        max_attempts=handlers[kind].max_attempts,
+        run_at=run_at or utc_now(),
+    )
+
+    if dedupe_key is not None:
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=['dedupe_key'],
+            index_where=db.text("status = 'pending'"))
+
+    db.session.execute(stmt)
+
+
+def backoff(attempts):
+    """Wait before retrying: 10s, 40s, 90s, ... capped at an hour."""
+
+    return timedelta(seconds=min(10 * attempts ** 2, 3600))
+
+
+def run_one():
+    """Claim and run one due job. Returns False if none was due."""
+
+    claimed = (Job.query
+               .filter(Job.status == 'pending', Job.run_at <= utc_now())
+               .order_by(Job.run_at)
+               .with_for_update(skip_locked=True)
+               .limit(1)
+               .first())
+
+    if claimed is None:
+        db.session.rollback()
+        return False
+
+    claimed.attempts += 1
+
+    try:
+        with db.session.begin_nested():
+            handlers[claimed.kind](**claimed.payload)
+    except Exception:
+        claimed.last_error = traceback.format_exc()
+        if claimed.attempts >= claimed.max_attempts:
+            claimed.status = 'failed'
+        else:
+            claimed.run_at = datetime.utcnow() + backoff(claimed.attempts)
+    else:
+        db.session.delete(claimed)
+
+    db.session.commit()
+    return True
+
+
+def work(app, concurrency=1, burst=False, poll_interval=1.0):
+    """Run jobs on `concurrency` threads until stopped.
+
+    With `burst`, each thread exits once no jobs are due.
+    """
+
+    stopping = threading.Event()
+
+    def loop():
+        with app.app_context():
+            while not stopping.is_set():
+                try:
+                    ran = run_one()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception("Job worker error")
+                    ran = False
+                finally:
+                    db.session.remove()
+
+                if not ran:
+                    if burst:
+                        return
+                    stopping.wait(poll_interval)
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stopping.set())
+
+    threads = [threading.Thread(target=loop, name=f'jobs-{i}')
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(0.2)
+
+
+cli = AppGroup('jobs', help="Run background jobs.")
+
+
+@cli.command('work')
+@click.option('--concurrency', default=2, help="Jobs to run at once.")
+@click.option('--burst', is_flag=True, help="Exit once no jobs are due.")
+def work_command(concurrency, burst):
+    """Run queued jobs."""
+
+    work(current_app._get_current_object(), concurrency=concurrency, burst=burst)
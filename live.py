@@ -0,0 +1,264 @@
+"""Live timeline updates over server-sent events.
+
+`messages_add` announces each new message with PostgreSQL NOTIFY, which is
+only delivered once the transaction commits. Each worker runs one listener
+thread that LISTENs on the channel and hands messages to the streams open on
+that worker.
+
+Every stream has a small bounded buffer. A client that can't keep up isn't
+allowed to grow it: the buffer is dropped and the client is told to reload
+its timeline instead.
+
+Under gunicorn each open stream holds one of the worker's threads, so a
+worker serves at most LIVE_MAX_STREAMS of them and each ends after
+LIVE_STREAM_SECONDS. EventSource reconnects by itself, sending the id of the
+last event it saw, and `missed_events` replays what it missed in between. A
+client turned away because the worker is full is asked to retry later.
+"""
+
+import json
+import logging
+import select
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import text
+
+import uploads
+from models import db, Message
+
+CHANNEL = 'new_message'
+
+# Events buffered per connection before it's considered too slow.
+QUEUE_SIZE = 50
+
+# Seconds between keepalive comments on an idle stream.
+HEARTBEAT = 15
+
+# Milliseconds a client waits before reconnecting, normally and when the
+# worker had no room for its stream.
+RETRY_MS = 3000
+BUSY_RETRY_MS = 30000
+
+OVERFLOW = object()
+
+logger = logging.getLogger('warbler.live')
+
+
+def message_event(msg):
+    """The event sent to streams for `msg`."""
+
+    return {
+        'id': msg.id,
+        'user_id': msg.user_id,
+        'username': msg.user.username,
+        'image_url': uploads.thumb(msg.user.image_url, 'sm'),
+        'text': msg.text,
+        'date': msg.timestamp.strftime('%d %B %Y'),
+    }
+
+
+def announce_message(msg):
+    """Queue a NOTIFY for `msg`; it's sent when the session commits."""
+
+    db.session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                       {'channel': CHANNEL, 'payload': json.dumps(message_event(msg))})
+
+
+def missed_events(user_ids, last_id):
+    """Events for messages by `user_ids` posted after `last_id`, oldest first.
+
+    Returns None if there are more than a stream's buffer holds, so the
+    client should reload instead.
+    """
+
+    messages = (Message
+                .query
+                .filter(Message.user_id.in_(user_ids), Message.id > last_id)
+                .order_by(Message.id)
+                .options(db.joinedload(Message.user))
+                .limit(QUEUE_SIZE + 1)
+                .all())
+
+    if len(messages) > QUEUE_SIZE:
+        return None
+    return [message_event(msg) for msg in messages]
+
+
+class Subscription:
+    """One open stream: the authors it wants and its pending events."""
+
+    def __init__(self, user_ids, maxsize=QUEUE_SIZE):
+        self.user_ids = frozenset(user_ids)
+        self.overflowed = False
+        self._events = deque()
+        self._maxsize = maxsize
+        self._ready = threading.Condition()
+
+    def offer(self, event):
+        """Buffer `event`, or give up on this client if it's fallen behind."""
+
+        with self._ready:
+            if len(self._events) >= self._maxsize:
+                self.overflowed = True
+                self._events.clear()
+            elif not self.overflowed:
+                self._events.append(event)
+            self._ready.notify()
+
+    def next_event(self, timeout):
+        """Return the next event, OVERFLOW, or None if nothing arrived."""
+
+        with self._ready:
+            if not self._events and not self.overflowed:
+                self._ready.wait(timeout)
+            if self.overflowed:
+                return OVERFLOW
+            return self._events.popleft() if self._events else None
+
+
+class Broker:
+    """In-process pub/sub between the listener thread and open streams."""
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_ids, limit=None):
+        """Open a subscription, or return None if `limit` are already open."""
+
+        subscription = Subscription(user_ids)
+        with self._lock:
+            if limit is not None and len(self._subscriptions) >= limit:
+                return None
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+
+        for subscription in subscriptions:
+            if event['user_id'] in subscription.user_ids:
+                subscription.offer(event)
+
+
+broker = Broker()
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def notifications(conn):
+    """Yield NOTIFY payloads received on `conn`, forever.
+
+    Works with either driver SQLAlchemy may pick for postgresql://:
+    psycopg 3 has a notifies() generator, psycopg2 a list filled by poll().
+    """
+
+    if callable(conn.notifies):
+        while True:
+            for notify in conn.notifies(timeout=HEARTBEAT):
+                yield notify.payload
+
+    while True:
+        # Poll before waiting: libpq may already have read a NOTIFY off the
+        # socket, and select() would never see it.
+        conn.poll()
+        while conn.notifies:
+            yield conn.notifies.pop(0).payload
+        select.select([conn], [], [], HEARTBEAT)
+
+
+def _listen(engine):
+    """Forward NOTIFYs on CHANNEL to the broker, reconnecting on errors."""
+
+    while True:
+        conn = payloads = None
+        try:
+            # Detached, so the pool never hands out a LISTENing connection.
+            fairy = engine.raw_connection()
+            fairy.detach()
+            conn = fairy.dbapi_connection
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {CHANNEL}")
+
+            payloads = notifications(conn)
+            for payload in payloads:
+                broker.publish(json.loads(payload))
+        except Exception:
+            logger.exception("Live listener failed; reconnecting")
+            time.sleep(1)
+        finally:
+            # psycopg 3 holds the connection's lock inside notifies(), so the
+            # generator has to finish before the connection can close.
+            if payloads is not None:
+                payloads.close()
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    logger.exception("Couldn't close the live listener's connection")
+
+
+def ensure_listener(app):
+    """Start this worker's listener thread, once.
+
+    It's started on first use rather than at import, so a preloaded master
+    doesn't start a thread that wouldn't survive the fork.
+    """
+
+    global _listener
+
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            with app.app_context():
+                engine = db.engine
+            _listener = threading.Thread(
+                target=_listen, args=(engine,), name='live-listener', daemon=True)
+            _listener.start()
+
+
+def _frame(event):
+    return f"id: {event['id']}\nevent: message\ndata: {json.dumps(event)}\n\n"
+
+
+def event_stream(subscription, replay=(), max_seconds=None):
+    """Yield SSE frames for `subscription` until the client goes away.
+
+    `replay` is sent first; the same messages arriving live are skipped.
+    After `max_seconds` the stream ends and the client reconnects.
+    """
+
+    deadline = None if max_seconds is None else time.monotonic() + max_seconds
+    replayed = {event['id'] for event in replay}
+
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+
+        for event in replay:
+            yield _frame(event)
+
+        while True:
+            timeout = HEARTBEAT
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    return
+
+            event = subscription.next_event(timeout)
+
+            if event is None:
+                yield ": keepalive\n\n"
+            elif event is OVERFLOW:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            elif event['id'] not in replayed:
+                yield _frame(event)
+    finally:
+        broker.unsubscribe(subscription)
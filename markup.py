@@ -0,0 +1,55 @@
+"""Parsing and rendering the text of a warble.
+
+#tags and @mentions are pulled out at post time: tags are stored in
+message_tags (see MessageTag), so tag pages never have to search message
+text, and mentions become notifications (see Notification). The `linkify`
+template filter turns both into links when messages are shown.
+"""
+
+import re
+
+from markupsafe import Markup, escape
+
+TAG_LENGTH = 50
+
+# A tag starts a word: "#flask" and "(#flask)" count, "a#b" and "&#39;" don't.
+# Any length matches; normalize_tag cuts long ones down to TAG_LENGTH.
+TAG = re.compile(r'(?<![\w&#])#(\w+)')
+
+# "@bob", "@bob.smith" and "(@bob)" mention someone; "me@bob.com" doesn't.
+MENTION = re.compile(r'(?<![\w@.])@(\w+(?:[.-]\w+)*)')
+
+
+def normalize_tag(tag):
+    """Tags match case-insensitively; store and look them up casefolded.
+
+    Casefolding can lengthen a tag ("ß" becomes "ss"), so the result is cut
+    back to TAG_LENGTH to fit message_tags.tag.
+    """
+
+    return tag.casefold()[:TAG_LENGTH]
+
+
+def parse_tags(text):
+    """The distinct normalized tags in `text`, in order of first use."""
+
+    return list(dict.fromkeys(normalize_tag(tag) for tag in TAG.findall(text)))
+
+
+def parse_mentions(text):
+    """The distinct usernames @mentioned in `text`, in order of first use."""
+
+    return list(dict.fromkeys(MENTION.findall(text)))
+
+
+def linkify(text):
+    """Template filter: escape `text`, link #tags and @mentions."""
+
+    html = str(escape(text))
+    html = TAG.sub(
+        lambda m: Markup('<a href="/tags/{}">#{}</a>').format(normalize_tag(m.group(1)), m.group(1)),
+        html)
+    html = MENTION.sub(
+        lambda m: Markup('<a href="/users/@{0}">@{0}</a>').format(m.group(1)),
+        html)
+    return Markup(html)
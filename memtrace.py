@@ -0,0 +1,176 @@
+"""Per-endpoint memory use, from tracemalloc.
+
+With MEMTRACE_SAMPLE_RATE above 0, that share of requests runs with
+tracemalloc on. For each one we record its peak traced memory and where the
+memory was allocated, as one JSON line in MEMTRACE_LOG:
+
+- `sites`: the biggest allocating lines anywhere, and
+- `app_sites`: the same allocations charged to the innermost line of *our*
+  code that led to them, so `len(user.likes)` shows up instead of a line
+  deep in SQLAlchemy.
+
+Allocation sites come from a snapshot taken just before the template renders
+(when the view's data is all alive), or at the end of the request if there
+is no template. `flask memtrace report` summarizes the log per endpoint.
+
+tracemalloc is process-wide, so only one request per process is traced at a
+time, and with threaded workers the peak can include other threads'
+allocations; run with GUNICORN_THREADS=1 for clean numbers. Requests that
+aren't sampled pay nothing: tracemalloc is off between traced requests.
+"""
+
+import collections
+import json
+import os
+import random
+import threading
+import time
+import tracemalloc
+
+import click
+from flask import before_render_template, current_app, g, request
+from flask.cli import AppGroup
+
+TOP_SITES = 10
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+SITE_PACKAGES = f'{os.sep}site-packages{os.sep}'
+
+_lock = threading.Lock()
+
+
+def _is_app_file(filename):
+    return filename.startswith(APP_ROOT) and SITE_PACKAGES not in filename
+
+
+def _site(frame):
+    filename = frame.filename
+    if _is_app_file(filename):
+        filename = os.path.relpath(filename, APP_ROOT)
+    return f"{filename}:{frame.lineno}"
+
+
+def summarize(snapshot):
+    """Top allocation sites in `snapshot`: raw, and charged to our code."""
+
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+    ])
+
+    sites = [{'site': _site(stat.traceback[0]), 'size': stat.size, 'count': stat.count}
+             for stat in snapshot.statistics('lineno')[:TOP_SITES]]
+
+    app_sizes = collections.Counter()
+    app_counts = collections.Counter()
+    for trace in snapshot.traces:
+        # Frames run oldest first; find the newest one that's ours.
+        for frame in reversed(trace.traceback):
+            if _is_app_file(frame.filename):
+                app_sizes[_site(frame)] += trace.size
+                app_counts[_site(frame)] += 1
+                break
+
+    app_sites = [{'site': site, 'size': size, 'count': app_counts[site]}
+                 for site, size in app_sizes.most_common(TOP_SITES)]
+
+    return sites, app_sites
+
+
+def _take_snapshot(*args, **kwargs):
+    if g.get('memtrace') and 'memtrace_snapshot' not in g:
+        g.memtrace_snapshot = tracemalloc.take_snapshot()
+
+
+def init_app(app):
+    """Trace a sample of requests, if MEMTRACE_SAMPLE_RATE is set."""
+
+    sample_rate = app.config.get('MEMTRACE_SAMPLE_RATE', 0)
+    if sample_rate <= 0:
+        return
+
+    path = app.config['MEMTRACE_LOG']
+    frames = app.config.get('MEMTRACE_FRAMES', 40)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    before_render_template.connect(_take_snapshot, app)
+
+    @app.before_request
+    def start_memtrace():
+        if random.random() < sample_rate and _lock.acquire(blocking=False):
+            g.memtrace = True
+            tracemalloc.start(frames)
+
+    @app.after_request
+    def snapshot_memtrace(response):
+        _take_snapshot()
+        return response
+
+    @app.teardown_request
+    def finish_memtrace(exc):
+        if not g.pop('memtrace', False):
+            return
+
+        try:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = g.pop('memtrace_snapshot', None) or tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            sites, app_sites = summarize(snapshot)
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            _lock.release()
+
+        entry = {
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'endpoint': request.endpoint or 'unmatched',
+            'path': request.full_path,
+            'peak': peak,
+            'retained': current,
+            'sites': sites,
+            'app_sites': app_sites,
+        }
+        with open(path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+
+def report(lines):
+    """Per-endpoint summary rows, biggest peak first."""
+
+    endpoints = {}
+    for line in lines:
+        entry = json.loads(line)
+        stats = endpoints.setdefault(entry['endpoint'], {
+            'endpoint': entry['endpoint'], 'requests': 0, 'total_peak': 0,
+            'max_peak': 0, 'sites': collections.Counter(),
+        })
+        stats['requests'] += 1
+        stats['total_peak'] += entry['peak']
+        stats['max_peak'] = max(stats['max_peak'], entry['peak'])
+        for site in entry['app_sites']:
+            stats['sites'][site['site']] = max(stats['sites'][site['site']], site['size'])
+
+    return sorted(endpoints.values(), key=lambda stats: stats['max_peak'], reverse=True)
+
+
+cli = AppGroup('memtrace', help="Per-endpoint memory use.")
+
+
+@cli.command('report')
+@click.option('--sites', default=3, help="Allocation sites to show per endpoint.")
+def report_command(sites):
+    """Summarize MEMTRACE_LOG by endpoint, biggest peak first."""
+
+    path = current_app.config['MEMTRACE_LOG']
+    if not os.path.exists(path):
+        raise click.ClickException(f"No memory traces in {path} yet.")
+
+    with open(path) as f:
+        rows = report(f)
+
+    for stats in rows:
+        mean = stats['total_peak'] / stats['requests']
+        click.echo(f"{stats['endpoint']}: {stats['requests']} requests, "
+                   f"peak {stats['max_peak'] / 1024:.0f} KiB max, {mean / 1024:.0f} KiB mean")
+        for site, size in stats['sites'].most_common(sites):
+            click.echo(f"    {size / 1024:8.0f} KiB  {site}")
@@ -0,0 +1,150 @@
+"""Prometheus metrics, served at /metrics.
+
+Each gunicorn worker records into its own files under
+PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py sets and clears it), and a
+scrape of any worker adds them all up. Without that variable, e.g. under
+`flask run`, the numbers are just this process's.
+
+Hit ratios come from warbler_cache_requests_total, e.g.
+
+    sum by (cache) (rate(warbler_cache_requests_total{result="hit"}[5m]))
+      / sum by (cache) (rate(warbler_cache_requests_total[5m]))
+"""
+
+import os
+import threading
+import time
+
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+REQUESTS = Counter(
+    'warbler_http_requests_total', "Requests handled.",
+    ['endpoint', 'method', 'status'])
+
+LATENCY = Histogram(
+    'warbler_http_request_duration_seconds', "Time to build a response.",
+    ['endpoint'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+
+POOL_CHECKOUTS = Counter(
+    'warbler_db_pool_checkouts_total', "Connections taken from the pool.")
+
+POOL_WAIT = Histogram(
+    'warbler_db_pool_wait_seconds', "Time spent waiting for a pooled connection.",
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 30))
+
+POOL_CHECKED_OUT = Gauge(
+    'warbler_db_pool_checked_out', "Connections in use.",
+    multiprocess_mode='livesum')
+
+POOL_OVERFLOW = Gauge(
+    'warbler_db_pool_overflow', "Connections open beyond the pool size.",
+    multiprocess_mode='livesum')
+
+CACHE = Counter(
+    'warbler_cache_requests_total', "Lookups answered from a cache (hit) or not.",
+    ['cache', 'result'])
+
+BCRYPT = Histogram(
+    'warbler_bcrypt_seconds', "Time spent hashing or checking passwords.",
+    ['op'],
+    buckets=(.05, .1, .2, .3, .5, 1, 2))
+
+
+def cache_lookup(cache, hit):
+    """Count one lookup of `cache`."""
+
+    CACHE.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that reports checkouts, waits and overflow.
+
+    The counts come from pool events listened for on the class, so a pool
+    remade by dispose() keeps exactly one set of listeners. Only the wait
+    is timed, around connect(). The gauges assume one such pool per
+    process, as the app has.
+    """
+
+    lock = threading.Lock()
+    open_connections = 0
+    pool_size = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        InstrumentedQueuePool.pool_size = self.size()
+
+    def connect(self):
+        started = time.perf_counter()
+        conn = super().connect()
+        POOL_WAIT.observe(time.perf_counter() - started)
+        return conn
+
+    @classmethod
+    def count_open(cls, change):
+        with cls.lock:
+            cls.open_connections += change
+            POOL_OVERFLOW.set(max(cls.open_connections - cls.pool_size, 0))
+
+
+@event.listens_for(InstrumentedQueuePool, 'checkout')
+def _pool_checkout(dbapi_connection, record, proxy):
+    POOL_CHECKOUTS.inc()
+    POOL_CHECKED_OUT.inc()
+
+
+@event.listens_for(InstrumentedQueuePool, 'checkin')
+def _pool_checkin(dbapi_connection, record):
+    POOL_CHECKED_OUT.dec()
+
+
+@event.listens_for(InstrumentedQueuePool, 'connect')
+def _pool_connect(dbapi_connection, record):
+    InstrumentedQueuePool.count_open(1)
+
+
+@event.listens_for(InstrumentedQueuePool, 'close')
+def _pool_close(dbapi_connection, record):
+    InstrumentedQueuePool.count_open(-1)
+
+
+@event.listens_for(InstrumentedQueuePool, 'detach')
+def _pool_detach(dbapi_connection, record):
+    # A detached connection (the live listener's) leaves the pool for good.
+    POOL_CHECKED_OUT.dec()
+    InstrumentedQueuePool.count_open(-1)
+
+
+def render():
+    """The current metrics in Prometheus text format."""
+
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    """Time every request and use the instrumented connection pool."""
+
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].setdefault('poolclass', InstrumentedQueuePool)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'
+            LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+            REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+        return response
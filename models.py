@@ -1,13 +1,48 @@
 """SQLAlchemy models for Warbler."""
 
-from datetime import datetime
+import os
+import socket
+from datetime import datetime, timedelta
 
 from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import joinedload, load_only
+
+import follow_graph
+import markup
+import metrics
+import snowflake
+import tracing
 
 bcrypt = Bcrypt()
 db = SQLAlchemy()
 
+# Users per page on follower/following listings.
+FOLLOWS_PER_PAGE = 48
+LIKES_PER_PAGE = 50
+TAG_PAGE_SIZE = 50
+NOTIFICATIONS_PER_PAGE = 50
+
+# Timelines look this far back first; see Message.newest.
+RECENT_MESSAGES = timedelta(days=31)
+
+
+def encode_cursor(at, row_id):
+    """A page cursor for keyset pagination on (timestamp, id)."""
+
+    return f"{at.isoformat()}_{row_id}"
+
+
+def decode_cursor(cursor):
+    """Turn a page cursor back into (timestamp, id), or None."""
+
+    try:
+        at, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(at), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
 
 class Follows(db.Model):
     """Connection of a follower <-> followed_user."""
@@ -26,6 +61,20 @@ class Follows(db.Model):
         primary_key=True,
     )
 
+    created = db.Column(
+        db.DateTime,
+        nullable=False,
+        server_default=db.func.now(),
+    )
+
+    __table_args__ = (
+        # Follower/following pages walk these newest first.
+        db.Index('ix_follows_followed_created',
+                 'user_being_followed_id', 'created', 'user_following_id'),
+        db.Index('ix_follows_following_created',
+                 'user_following_id', 'created', 'user_being_followed_id'),
+    )
+
 
 class Likes(db.Model):
     """Mapping user likes to warbles."""
@@ -39,13 +88,20 @@ class Likes(db.Model):
 
     user_id = db.Column(
         db.Integer,
-        db.ForeignKey('users.id', ondelete='cascade')
+        db.ForeignKey('users.id', ondelete='cascade'),
+        index=True,
     )
 
     message_id = db.Column(
-        db.Integer,
+        db.BigInteger,
         db.ForeignKey('messages.id', ondelete='cascade'),
-        unique=True
+        index=True,
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'message_id'),
+        # Liked-messages pages walk a user's likes newest first.
+        db.Index('ix_likes_user_id_id', 'user_id', 'id'),
     )
 
 
@@ -94,41 +150,233 @@ class User(db.Model):
         nullable=False,
     )
 
-    messages = db.relationship('Message')
+    # PageRank over the follow graph, averaging 1; see ranking.py.
+    popularity = db.Column(
+        db.Float,
+        nullable=False,
+        default=0,
+        server_default='0',
+        index=True,
+    )
+
+    # Set when the account is deleted; its rows are purged in the background.
+    deleted_at = db.Column(
+        db.DateTime,
+    )
+
+    # Notifications since the user last opened them, kept up to date by
+    # Notification.notify_mentions so the nav badge needs no COUNT.
+    unread_notifications = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # The foreign keys cascade in the database, so deleting a user never
+    # loads these collections (passive_deletes).
+
+    messages = db.relationship('Message', passive_deletes=True)
 
     followers = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_being_followed_id == id),
-        secondaryjoin=(Follows.user_following_id == id)
+        secondaryjoin=(Follows.user_following_id == id),
+        passive_deletes=True,
     )
 
     following = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_following_id == id),
-        secondaryjoin=(Follows.user_being_followed_id == id)
+        secondaryjoin=(Follows.user_being_followed_id == id),
+        passive_deletes=True,
     )
 
     likes = db.relationship(
         'Message',
-        secondary="likes"
+        secondary="likes",
+        passive_deletes=True,
     )
 
     def __repr__(self):
         return f"<User #{self.id}: {self.username}, {self.email}>"
 
+    def use_counts(self, messages, following, followers):
+        """Answer the *_count properties from these instead of querying.
+
+        asgi.py counts with its own queries (see User.counts); it has no
+        Flask-SQLAlchemy session for the properties to query with.
+        """
+
+        self._counts = {'messages': messages, 'following': following, 'followers': followers}
+
+    def use_following(self, user_ids, following_ids):
+        """Answer is_following for `user_ids` from `following_ids` instead of querying."""
+
+        self._following = {user_id: user_id in following_ids for user_id in user_ids}
+
+    @classmethod
+    def counts(cls, user_id):
+        """One query for a user's (messages, following, followers) counts."""
+
+        def count(model, *criteria):
+            return db.select(db.func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+        return db.select(count(Message, Message.user_id == user_id),
+                         count(Follows, Follows.user_following_id == user_id),
+                         count(Follows, Follows.user_being_followed_id == user_id))
+
+    def _count(self, collection, make_query):
+        """Count a collection without loading it.
+
+        The query is only built when it's needed, so counts given to
+        use_counts never touch the Flask-SQLAlchemy session.
+        """
+
+        counts = getattr(self, '_counts', None)
+        if counts is not None:
+            return counts[collection]
+        return make_query().count()
+
+    @property
+    def messages_count(self):
+        return self._count('messages', lambda: Message.query.filter_by(user_id=self.id))
+
+    # Follow counts include deleted accounts until their purge removes the
+    # follows; see follow_graph.py.
+
+    @property
+    def followers_count(self):
+        graph = follow_graph.get_index()
+        if graph:
+            return graph.followers_count(self.id)
+        return self._count(
+            'followers', lambda: Follows.query.filter_by(user_being_followed_id=self.id))
+
+    @property
+    def following_count(self):
+        graph = follow_graph.get_index()
+        if graph:
+            return graph.following_count(self.id)
+        return self._count(
+            'following', lambda: Follows.query.filter_by(user_following_id=self.id))
+
+    def _follows_page(self, this_side, other_side, before, per_page):
+        """One page of users on the other side of this user's follows.
+
+        Newest follow first, keyed on (created, other user id), so each
+        page is a single index range scan however deep it is.
+        """
+
+        query = (User.query
+                 .join(Follows, other_side == User.id)
+                 .add_columns(Follows.created)
+                 .filter(this_side == self.id, User.deleted_at.is_(None))
+                 .options(load_only(User.id, User.username, User.image_url,
+                                    User.header_image_url, User.bio))
+                 .order_by(Follows.created.desc(), other_side.desc()))
+
+        cursor = decode_cursor(before)
+        if cursor:
+            query = query.filter(db.tuple_(Follows.created, other_side) < cursor)
+
+        rows = query.limit(per_page + 1).all()
+        users = [user for user, created in rows[:per_page]]
+
+        next_cursor = None
+        if len(rows) > per_page:
+            user, created = rows[per_page - 1]
+            next_cursor = encode_cursor(created, user.id)
+
+        return users, next_cursor
+
+    def followers_page(self, before=None, per_page=FOLLOWS_PER_PAGE):
+        """Return (users, next cursor) for a page of this user's followers."""
+
+        return self._follows_page(Follows.user_being_followed_id,
+                                  Follows.user_following_id, before, per_page)
+
+    def following_page(self, before=None, per_page=FOLLOWS_PER_PAGE):
+        """Return (users, next cursor) for a page of users this user follows."""
+
+        return self._follows_page(Follows.user_following_id,
+                                  Follows.user_being_followed_id, before, per_page)
+
+    def following_ids_among(self, user_ids):
+        """Which of `user_ids` does this user follow? One keyed query."""
+
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+
+        graph = follow_graph.get_index()
+        if graph:
+            return {user_id for user_id in user_ids if graph.follows(self.id, user_id)}
+
+        rows = (db.session
+                .query(Follows.user_being_followed_id)
+                .filter(Follows.user_following_id == self.id,
+                        Follows.user_being_followed_id.in_(user_ids))
+                .all())
+        return {user_id for (user_id,) in rows}
+
+    def liked_messages(self, before=None):
+        """Query for the messages this user liked, most recently liked first.
+
+        Ordered by like id, so `before` (a like id) makes each page one
+        range scan of ix_likes_user_id_id. Rows are (message, like id).
+        """
+
+        query = (db.session.query(Message, Likes.id)
+                 .join(Likes, Likes.message_id == Message.id)
+                 .filter(Likes.user_id == self.id, Message.visible())
+                 .options(joinedload(Message.user))
+                 .order_by(Likes.id.desc()))
+
+        if before is not None:
+            query = query.filter(Likes.id < before)
+
+        return query
+
+    def liked_messages_page(self, before=None, per_page=LIKES_PER_PAGE):
+        """Return (messages, next cursor) for a page of this user's likes."""
+
+        rows = self.liked_messages(before).limit(per_page + 1).all()
+        messages = [message for message, like_id in rows[:per_page]]
+
+        next_cursor = None
+        if len(rows) > per_page:
+            next_cursor = rows[per_page - 1][1]
+
+        return messages, next_cursor
+
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return other_user.is_following(self)
 
     def is_following(self, other_user):
-        """Is this user following `other_user`?"""
+        """Is this user following `other_user`?
+
+        Answered from use_following or the follow graph index when there is
+        one, or from `following` if it's already loaded; otherwise one keyed
+        query.
+        """
 
-        found_user_list = [user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        known = getattr(self, '_following', {})
+        if other_user.id in known:
+            return known[other_user.id]
+
+        graph = follow_graph.get_index()
+        if graph:
+            return graph.follows(self.id, other_user.id)
+
+        if 'following' not in inspect(self).unloaded:
+            return any(user.id == other_user.id for user in self.following)
+
+        return other_user.id in self.following_ids_among([other_user.id])
 
     @classmethod
     def signup(cls, username, email, password, image_url):
@@ -137,7 +385,8 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        with metrics.BCRYPT.labels('hash').time(), tracing.span('bcrypt.hash'):
+            hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
 
         user = User(
             username=username,
@@ -163,10 +412,13 @@ class User(db.Model):
         If can't find matching user (or if password is wrong), returns False.
         """
 
-        user = cls.query.filter_by(username=username).first()
+        user = cls.query.filter_by(username=username, deleted_at=None).first()
 
-        if user and bcrypt.check_password_hash(user.password, password):
-            return user
+        if user:
+            with metrics.BCRYPT.labels('check').time(), tracing.span('bcrypt.check'):
+                valid = bcrypt.check_password_hash(user.password, password)
+            if valid:
+                return user
 
         else: 
             # raise cls.AuthenticationError("Incorrect username or password")
@@ -175,14 +427,108 @@ class User(db.Model):
  
 
 
+# Seconds a process keeps its message id worker number without renewing it.
+MESSAGE_ID_LEASE_SECONDS = 60
+
+
+class MessageIdLease(db.Model):
+    """Which process holds a message id worker number, and until when.
+
+    A process leases the lowest number that's free or has expired, and
+    renews it while it makes ids (see snowflake.IdGenerator), so no two live
+    processes ever share one.
+    """
+
+    __tablename__ = 'message_id_leases'
+
+    worker = db.Column(
+        db.Integer,
+        primary_key=True,
+        autoincrement=False,
+    )
+
+    holder = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    # Naive UTC.
+    expires_at = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+
+LEASE_SQL = """
+    INSERT INTO message_id_leases (worker, holder, expires_at)
+    SELECT w.n, :holder, timezone('utc', now()) + make_interval(secs => :seconds)
+    FROM generate_series(0, :workers - 1) AS w(n)
+    WHERE NOT EXISTS (SELECT 1 FROM message_id_leases lease
+                      WHERE lease.worker = w.n AND lease.expires_at > timezone('utc', now()))
+    ORDER BY w.n
+    LIMIT 1
+    ON CONFLICT (worker) DO UPDATE
+        SET holder = excluded.holder, expires_at = excluded.expires_at
+        WHERE message_id_leases.expires_at <= timezone('utc', now())
+    RETURNING worker
+"""
+
+RENEW_SQL = """
+    UPDATE message_id_leases
+    SET expires_at = timezone('utc', now()) + make_interval(secs => :seconds)
+    WHERE worker = :worker AND holder = :holder
+    RETURNING worker
+"""
+
+
+def _message_id_holder():
+    # Per process, so a forked child never renews its parent's lease.
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _lease_message_id_worker():
+    params = {'holder': _message_id_holder(), 'seconds': MESSAGE_ID_LEASE_SECONDS,
+              'workers': 1 << snowflake.WORKER_BITS}
+
+    # Losing a race for a number just means trying the next free one.
+    for _ in range(3):
+        with db.engine.connect() as conn:
+            worker = conn.scalar(db.text(LEASE_SQL), params)
+            conn.commit()
+        if worker is not None:
+            return worker
+
+    raise RuntimeError("No message id worker number is free")
+
+
+def _renew_message_id_worker(worker):
+    with db.engine.connect() as conn:
+        renewed = conn.scalar(db.text(RENEW_SQL), {
+            'worker': worker, 'holder': _message_id_holder(),
+            'seconds': MESSAGE_ID_LEASE_SECONDS})
+        conn.commit()
+    return renewed is not None
+
+
+message_ids = snowflake.IdGenerator(_lease_message_id_worker, _renew_message_id_worker,
+                                    renew_every=MESSAGE_ID_LEASE_SECONDS / 3)
+
+
 class Message(db.Model):
-    """An individual message ("warble")."""
+    """An individual message ("warble").
+
+    Ids are time-ordered (see snowflake.py), so newest first is simply
+    id descending. The table is partitioned by id range, a month per
+    partition; see partitions.py.
+    """
 
     __tablename__ = 'messages'
 
     id = db.Column(
-        db.Integer,
+        db.BigInteger,
         primary_key=True,
+        autoincrement=False,
+        default=message_ids.next_id,
     )
 
     text = db.Column(
@@ -193,7 +539,7 @@ class Message(db.Model):
     timestamp = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow(),
+        default=datetime.utcnow,
     )
 
     user_id = db.Column(
@@ -204,13 +550,398 @@ class Message(db.Model):
 
     user = db.relationship('User')
 
+    __table_args__ = (
+        # Timelines ask for one author's (or a few authors') newest messages.
+        db.Index('ix_messages_user_id_id', 'user_id', 'id'),
+        {'postgresql_partition_by': 'RANGE (id)'},
+    )
+
+    @classmethod
+    def visible(cls):
+        """Filter criterion hiding messages by deleted accounts.
+
+        A deleted account's messages are purged in the background (see
+        accounts.py); until then every page showing messages filters them.
+        """
+
+        return cls.user.has(User.deleted_at.is_(None))
+
+    @classmethod
+    def newest(cls, query, limit):
+        """The newest `limit` messages from `query`.
+
+        Asks the last RECENT_MESSAGES first, so PostgreSQL only scans the
+        newest partitions, and only goes further back if that comes up short.
+        """
+
+        floor = snowflake.first_id_at(datetime.utcnow() - RECENT_MESSAGES)
+        messages = (query.filter(cls.id >= floor)
+                    .order_by(cls.id.desc()).limit(limit).all())
+
+        if len(messages) < limit:
+            messages += (query.filter(cls.id < floor)
+                         .order_by(cls.id.desc()).limit(limit - len(messages)).all())
+
+        return messages
+
+
+# Rows with no month partition (see partitions.py) land here, so an insert
+# never fails for want of one.
+event.listen(Message.__table__, 'after_create', db.DDL(
+    "CREATE TABLE messages_default PARTITION OF messages DEFAULT"))
+
+
+class MessageTag(db.Model):
+    """A #tag used in a message.
+
+    Message ids are time-ordered, so a tag's timeline, newest first, is one
+    backwards range scan of the primary key.
+    """
+
+    __tablename__ = 'message_tags'
+
+    tag = db.Column(
+        db.String(markup.TAG_LENGTH),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.BigInteger,
+        db.ForeignKey('messages.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    @classmethod
+    def for_message(cls, msg):
+        """Tag rows for a flushed message's text."""
+
+        return [cls(tag=tag, message_id=msg.id) for tag in markup.parse_tags(msg.text)]
+
+    @classmethod
+    def timeline(cls, tag, before=None, per_page=TAG_PAGE_SIZE):
+        """Return (messages, next cursor) for a page of a tag, newest first.
+
+        The cursor is the last message id shown.
+        """
+
+        query = (Message.query
+                 .join(cls, cls.message_id == Message.id)
+                 .filter(cls.tag == markup.normalize_tag(tag), Message.visible())
+                 .options(joinedload(Message.user))
+                 .order_by(cls.message_id.desc()))
+
+        if before is not None:
+            query = query.filter(cls.message_id < before)
+
+        rows = query.limit(per_page + 1).all()
+
+        next_cursor = None
+        if len(rows) > per_page:
+            next_cursor = rows[per_page - 1].id
+
+        return rows[:per_page], next_cursor
+
+
+class Notification(db.Model):
+    """Tells a user they were @mentioned in a message."""
+
+    __tablename__ = 'notifications'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+
+    message_id = db.Column(
+        db.BigInteger,
+        db.ForeignKey('messages.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+
+    created = db.Column(
+        db.DateTime,
+        nullable=False,
+        server_default=db.func.now(),
+    )
+
+    message = db.relationship('Message')
+
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_created', 'user_id', 'created', 'id'),
+    )
+
+    @classmethod
+    def notify_mentions(cls, msg):
+        """Notify everyone @mentioned in a flushed message.
+
+        One query resolves all the usernames; one UPDATE bumps the
+        recipients' unread counters. Returns the notified user ids.
+        """
+
+        usernames = markup.parse_mentions(msg.text)
+        if not usernames:
+            return []
+
+        user_ids = [user_id for (user_id,) in (db.session
+                    .query(User.id)
+                    .filter(User.username.in_(usernames),
+                            User.deleted_at.is_(None),
+                            User.id != msg.user_id)
+                    .all())]
+        if not user_ids:
+            return []
+
+        db.session.add_all([cls(user_id=user_id, message_id=msg.id) for user_id in user_ids])
+        (User.query
+         .filter(User.id.in_(user_ids))
+         .update({User.unread_notifications: User.unread_notifications + 1},
+                 synchronize_session=False))
+        return user_ids
+
+    @classmethod
+    def mark_read(cls, user_id, count=NOTIFICATIONS_PER_PAGE):
+        """Mark the newest `count` notifications read; return the unread before.
+
+        One locked UPDATE, so a mention arriving at the same moment is
+        either counted in what it returns or left unread, never lost.
+        """
+
+        return db.session.execute(db.text("""
+            WITH old AS (SELECT unread_notifications FROM users WHERE id = :uid FOR UPDATE)
+            UPDATE users SET unread_notifications = greatest(users.unread_notifications - :n, 0)
+            FROM old
+            WHERE users.id = :uid
+            RETURNING old.unread_notifications
+        """), {'uid': user_id, 'n': count}).scalar()
+
+    @classmethod
+    def page(cls, user_id, before=None, per_page=NOTIFICATIONS_PER_PAGE):
+        """Return (notifications, next cursor) for a user, newest first."""
+
+        query = (cls.query
+                 .filter(cls.user_id == user_id)
+                 .options(joinedload(cls.message).joinedload(Message.user))
+                 .order_by(cls.created.desc(), cls.id.desc()))
+
+        cursor = decode_cursor(before)
+        if cursor:
+            query = query.filter(db.tuple_(cls.created, cls.id) < cursor)
+
+        rows = query.limit(per_page + 1).all()
+
+        next_cursor = None
+        if len(rows) > per_page:
+            last = rows[per_page - 1]
+            next_cursor = encode_cursor(last.created, last.id)
+
+        return rows[:per_page], next_cursor
+
+
+class MessageDeletion(db.Model):
+    """Tombstone for a deleted message, so clients can drop it on refresh."""
+
+    __tablename__ = 'message_deletions'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.BigInteger,
+        nullable=False,
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index('ix_message_deletions_user_id_id', 'user_id', 'id'),
+    )
+
+
+class LikeBucket(db.Model):
+    """Net likes a message got in one time bucket; see trending.py."""
+
+    __tablename__ = 'like_buckets'
+
+    message_id = db.Column(
+        db.BigInteger,
+        db.ForeignKey('messages.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    bucket = db.Column(
+        db.DateTime,
+        primary_key=True,
+        index=True,
+    )
+
+    likes = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+
+class TrendingMessage(db.Model):
+    """One place in the precomputed trending leaderboard."""
+
+    __tablename__ = 'trending_messages'
+
+    rank = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.BigInteger,
+        db.ForeignKey('messages.id', ondelete='cascade'),
+        nullable=False,
+    )
+
+    # Likes per hour over the trending window.
+    score = db.Column(
+        db.Float,
+        nullable=False,
+    )
+
+
+class FollowSuggestion(db.Model):
+    """Someone a user might follow, precomputed from friends-of-friends."""
+
+    __tablename__ = 'follow_suggestions'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    suggested_user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    # How many of the people `user_id` follows also follow this user.
+    mutual_count = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    suggested_user = db.relationship('User', foreign_keys=[suggested_user_id])
+
+    __table_args__ = (
+        db.Index('ix_follow_suggestions_user_id_mutual_count',
+                 'user_id', db.text('mutual_count DESC')),
+    )
+
+
+def utc_now():
+    """The database's clock in UTC, to compare with datetime.utcnow() values."""
+
+    return db.func.timezone('utc', db.func.now())
+
+
+class Job(db.Model):
+    """A unit of deferred work, run by `flask jobs work`."""
+
+    __tablename__ = 'jobs'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    kind = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    payload = db.Column(
+        db.JSON,
+        nullable=False,
+        default=dict,
+    )
+
+    dedupe_key = db.Column(
+        db.Text,
+    )
+
+    status = db.Column(
+        db.Text,
+        nullable=False,
+        default='pending',
+    )
+
+    attempts = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    max_attempts = db.Column(
+        db.Integer,
+        nullable=False,
+        default=5,
+    )
+
+    # Naive UTC, like the times handlers schedule with datetime.utcnow().
+    run_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        server_default=utc_now(),
+    )
+
+    last_error = db.Column(
+        db.Text,
+    )
+
+    __table_args__ = (
+        # Workers only ever look for due, pending jobs.
+        db.Index('ix_jobs_pending_run_at', 'run_at',
+                 postgresql_where=db.text("status = 'pending'")),
+        # At most one pending job per dedupe key.
+        db.Index('ix_jobs_pending_dedupe_key', 'dedupe_key', unique=True,
+                 postgresql_where=db.text("status = 'pending'")),
+    )
+
+    def __repr__(self):
+        return f"<Job #{self.id}: {self.kind} {self.status}>"
+
 
 def connect_db(app):
     """Connect this database to provided Flask app.
 
-    You should call this in your Flask app.
+    You should call this in your Flask app. This doesn't open a connection or
+    issue any DDL, so it's cheap to call in every worker; use `init_db` to
+    create the tables.
     """
+    db.app = app
+    db.init_app(app)
+
+
+def init_db(app):
+    """Create all tables for the connected app."""
+
     with app.app_context():
-        db.app = app
-        db.init_app(app)
         db.create_all()
+
+
+def dispose_engine(app):
+    """Drop pooled connections inherited from a parent process.
+
+    Call this in a freshly forked worker. `close=False` leaves the parent's
+    sockets alone so the master doesn't see them shut underneath it.
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,302 @@
+"""Monthly partitions of `messages`, and an archive for old ones.
+
+`messages` is range-partitioned on id. Message ids are made from the time
+(snowflake.py), so each month is the id range from `first_id_at` of its
+first day up to the next month's, held in a partition named like
+`messages_2024_07`. Any query with an id bound, like Message.newest, only
+scans the partitions that bound can match. Rows with no month partition fall
+into `messages_default`.
+
+The current month and the next PREMAKE_MONTHS are made when the table is
+created, and kept ready by a daily `ensure_message_partitions` job, which
+`flask partitions ensure` starts. A month can't be made while the default
+partition holds rows for it; `ensure` reports those months and leaves them.
+
+`flask partitions archive` moves months older than ARCHIVE_AFTER_MONTHS out
+of the database into ARCHIVE_DIR, one gzipped JSON-lines file per month.
+Each line is a message with its tags and the ids of the users who liked it.
+The month's likes, tags and notifications are deleted with it, since they
+can't point at messages that aren't there, and users' unread counts drop by
+the unread notifications that go. `read_archive` reads a month back,
+for the profile's history pages.
+"""
+
+import gzip
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, text
+
+import jobs
+import snowflake
+from models import db, Message
+
+PREMAKE_MONTHS = 3
+
+PARTITION = re.compile(r'^messages_(\d{4})_(\d{2})$')
+ARCHIVE_FILE = re.compile(r'^messages_(\d{4})_(\d{2})\.jsonl\.gz$')
+
+PARTITIONS_SQL = """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'messages'::regclass
+"""
+
+ARCHIVE_SQL = """
+    SELECT m.id, m.text, m.timestamp, m.user_id,
+           coalesce(t.tags, '{{}}') AS tags,
+           coalesce(l.liked_by, '{{}}') AS liked_by
+    FROM {partition} m
+    LEFT JOIN (SELECT message_id, array_agg(tag ORDER BY tag) AS tags
+               FROM message_tags
+               WHERE message_id >= :low AND message_id < :high
+               GROUP BY message_id) t ON t.message_id = m.id
+    LEFT JOIN (SELECT message_id, array_agg(user_id ORDER BY user_id) AS liked_by
+               FROM likes
+               WHERE message_id >= :low AND message_id < :high
+               GROUP BY message_id) l ON l.message_id = m.id
+    ORDER BY m.id
+"""
+
+# A user's unread notifications are their newest `unread_notifications` (see
+# Notification.mark_read). Their rows are locked first, so no mention or
+# mark_read can move the count while the next statement ranks against it.
+LOCK_NOTIFIED_SQL = """
+    SELECT id FROM users
+    WHERE id IN (SELECT user_id FROM notifications
+                 WHERE message_id >= :low AND message_id < :high)
+    ORDER BY id
+    FOR UPDATE
+"""
+
+FORGET_UNREAD_SQL = """
+    UPDATE users SET unread_notifications = users.unread_notifications - gone.unread
+    FROM (SELECT ranked.user_id, count(*) AS unread
+          FROM (SELECT n.user_id, n.message_id,
+                       row_number() OVER (PARTITION BY n.user_id
+                                          ORDER BY n.created DESC, n.id DESC) AS position
+                FROM notifications n
+                WHERE n.user_id IN (SELECT user_id FROM notifications
+                                    WHERE message_id >= :low AND message_id < :high)) ranked
+          JOIN users u ON u.id = ranked.user_id
+          WHERE ranked.position <= u.unread_notifications
+            AND ranked.message_id >= :low AND ranked.message_id < :high
+          GROUP BY ranked.user_id) gone
+    WHERE users.id = gone.user_id
+"""
+
+
+def month_of(at):
+    return datetime(at.year, at.month, 1)
+
+
+def add_months(month, n):
+    years, month_index = divmod(month.month - 1 + n, 12)
+    return datetime(month.year + years, month_index + 1, 1)
+
+
+def parse_month(value):
+    """A 'YYYY-MM' string as the datetime of its first day."""
+
+    return datetime.strptime(value, '%Y-%m')
+
+
+def partition_name(month):
+    return f'messages_{month:%Y_%m}'
+
+
+def id_range(month):
+    """The [low, high) message ids made during `month`."""
+
+    return snowflake.first_id_at(month), snowflake.first_id_at(add_months(month, 1))
+
+
+def _month_from(match):
+    return datetime(int(match[1]), int(match[2]), 1)
+
+
+def existing(conn):
+    """Names of the partitions `messages` has now."""
+
+    return set(conn.execute(text(PARTITIONS_SQL)).scalars())
+
+
+def month_partitions(conn):
+    """Months that have a partition, oldest first."""
+
+    return sorted(_month_from(match) for match in map(PARTITION.match, existing(conn)) if match)
+
+
+def ensure(conn, start=None, ahead=PREMAKE_MONTHS):
+    """Make month partitions from `start` through `ahead` months from now.
+
+    Returns (made, blocked): the months made, and those skipped because
+    messages_default already has rows in their range.
+    """
+
+    month = month_of(start or datetime.utcnow())
+    last = add_months(month_of(datetime.utcnow()), ahead)
+    have = existing(conn)
+    made, blocked = [], []
+
+    while month <= last:
+        name = partition_name(month)
+        if name not in have:
+            low, high = id_range(month)
+            in_default = conn.execute(text(
+                "SELECT 1 FROM messages_default WHERE id >= :low AND id < :high LIMIT 1"),
+                {'low': low, 'high': high}).first()
+            if in_default:
+                blocked.append(month)
+            else:
+                conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF messages "
+                    f"FOR VALUES FROM ({low}) TO ({high})"))
+                made.append(month)
+        month = add_months(month, 1)
+
+    return made, blocked
+
+
+def schedule_ensure():
+    """Queue tomorrow's partition check, unless it's already queued."""
+
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    run_at = today + timedelta(days=1)
+    jobs.enqueue('ensure_message_partitions',
+                 dedupe_key=f'ensure_message_partitions:{run_at:%Y-%m-%d}', run_at=run_at)
+
+
+@jobs.job('ensure_message_partitions')
+def ensure_job():
+    ensure(db.session.connection())
+    schedule_ensure()
+
+
+@event.listens_for(Message.__table__, 'after_create')
+def _make_partitions(table, conn, **kwargs):
+    ensure(conn)
+
+
+def archive_path(directory, month):
+    return os.path.join(directory, f'{partition_name(month)}.jsonl.gz')
+
+
+def archived_months(directory):
+    """Months with an archive file in `directory`, newest first."""
+
+    if not os.path.isdir(directory):
+        return []
+
+    months = [_month_from(match) for match in map(ARCHIVE_FILE.match, os.listdir(directory))
+              if match]
+    return sorted(months, reverse=True)
+
+
+def _referencing_columns():
+    """Columns of other tables that point at messages.id."""
+
+    return [(fk.parent.table, fk.parent)
+            for table in db.metadata.sorted_tables
+            for fk in table.foreign_keys
+            if fk.column.table is Message.__table__]
+
+
+def archive(conn, month, directory):
+    """Write `month`'s messages to its archive file, then drop them.
+
+    The file is complete before anything is deleted; the caller commits.
+    """
+
+    name = partition_name(month)
+    if name not in existing(conn):
+        raise ValueError(f"{name} is not a partition of messages")
+
+    low, high = id_range(month)
+    path = archive_path(directory, month)
+    os.makedirs(directory, exist_ok=True)
+
+    rows = conn.execute(text(ARCHIVE_SQL.format(partition=name)), {'low': low, 'high': high},
+                        execution_options={'stream_results': True})
+
+    count = 0
+    with gzip.open(path + '.tmp', 'wt') as f:
+        for row in rows.mappings():
+            f.write(json.dumps({**row, 'timestamp': row['timestamp'].isoformat()}) + '\n')
+            count += 1
+    os.replace(path + '.tmp', path)
+
+    # Unread notifications about these messages stop counting as unread.
+    conn.execute(text(LOCK_NOTIFIED_SQL), {'low': low, 'high': high})
+    conn.execute(text(FORGET_UNREAD_SQL), {'low': low, 'high': high})
+
+    for table, column in _referencing_columns():
+        conn.execute(table.delete().where(column >= low, column < high))
+    conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
+
+    return count
+
+
+def read_archive(directory, month, user_id=None):
+    """Yield an archived month's messages, oldest first, as dicts.
+
+    With `user_id`, only that user's. Yields nothing if the month has no
+    archive.
+    """
+
+    path = archive_path(directory, month)
+    if not os.path.exists(path):
+        return
+
+    with gzip.open(path, 'rt') as f:
+        for line in f:
+            message = json.loads(line)
+            if user_id is None or message['user_id'] == user_id:
+                message['timestamp'] = datetime.fromisoformat(message['timestamp'])
+                yield message
+
+
+cli = AppGroup('partitions', help="Maintain the monthly partitions of messages.")
+
+
+@cli.command('ensure')
+@click.option('--ahead', default=PREMAKE_MONTHS, help="Months past this one to make.")
+def ensure_command(ahead):
+    """Make any missing month partitions, and keep them coming daily."""
+
+    made, blocked = ensure(db.session.connection(), ahead=ahead)
+    schedule_ensure()
+    db.session.commit()
+
+    for month in made:
+        click.echo(f"Made {partition_name(month)}.")
+    for month in blocked:
+        click.echo(f"Skipped {partition_name(month)}: messages_default has rows for it.")
+
+
+@cli.command('archive')
+@click.option('--before', help="Archive months before this one (YYYY-MM). "
+                               "Defaults to ARCHIVE_AFTER_MONTHS ago.")
+def archive_command(before):
+    """Move old months of messages into archive files."""
+
+    if before:
+        cutoff = parse_month(before)
+    else:
+        cutoff = add_months(month_of(datetime.utcnow()),
+                            -current_app.config['ARCHIVE_AFTER_MONTHS'])
+    directory = current_app.config['ARCHIVE_DIR']
+
+    for month in month_partitions(db.session.connection()):
+        if month >= cutoff:
+            break
+        count = archive(db.session.connection(), month, directory)
+        db.session.commit()
+        click.echo(f"Archived {count} messages from {month:%Y-%m}.")
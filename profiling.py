@@ -0,0 +1,187 @@
+"""Opt-in request profiling, written as flamegraph input.
+
+A request is profiled when it carries a valid X-Warbler-Profile header
+(`flask profile token` prints one; tokens expire) or when it's picked by
+PROFILE_SAMPLE_RATE. While it runs, a thread samples the request thread's
+stack about every millisecond. Each sample is filed under sql, template or
+view by the innermost frame that belongs to SQLAlchemy/the DB driver or to
+Jinja, and the stacks are written in the folded format that flamegraph.pl
+and speedscope read:
+
+    users_show;sql;users_show (app.py);messages_count (models.py);... 12
+
+One file per request goes to PROFILE_DIR, and the split is logged.
+
+With neither PROFILE_SECRET nor PROFILE_SAMPLE_RATE set, init_app
+installs nothing, so an unconfigured app pays no cost at all.
+"""
+
+import collections
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+HEADER = 'HTTP_X_WARBLER_PROFILE'
+TOKEN_MAX_AGE = 24 * 60 * 60
+INTERVAL = 0.001
+
+# Longest a profile runs, so an open event stream doesn't sample forever.
+MAX_SECONDS = 30
+
+SQL_PATHS = (f'{os.sep}sqlalchemy{os.sep}', f'{os.sep}psycopg2{os.sep}', f'{os.sep}psycopg{os.sep}')
+TEMPLATE_PATHS = (f'{os.sep}jinja2{os.sep}',)
+
+
+def _serializer(secret):
+    return URLSafeTimedSerializer(secret, salt='warbler-profile')
+
+
+def _category(filename):
+    if any(path in filename for path in SQL_PATHS):
+        return 'sql'
+    if any(path in filename for path in TEMPLATE_PATHS) or filename.endswith('.html'):
+        return 'template'
+    return None
+
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+class _Sampler(threading.Thread):
+    """Collects folded stacks of one thread until stopped."""
+
+    def __init__(self, thread_id, top):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.top = top
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+
+    def sample(self, frame):
+        labels, category = [], None
+        while frame is not None and frame is not self.top:
+            labels.append(_label(frame.f_code))
+            if category is None:
+                category = _category(frame.f_code.co_filename)
+            frame = frame.f_back
+        labels.append(category or 'view')
+        self.stacks[';'.join(reversed(labels))] += 1
+
+    def run(self):
+        deadline = time.monotonic() + MAX_SECONDS
+        while not self.stopped.wait(INTERVAL) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.sample(frame)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Profiler:
+    """WSGI middleware that profiles selected requests; see module docs."""
+
+    def __init__(self, wsgi_app, flask_app):
+        self.wsgi_app = wsgi_app
+        self.flask_app = flask_app
+        config = flask_app.config
+        self.secret = config.get('PROFILE_SECRET')
+        self.sample_rate = config.get('PROFILE_SAMPLE_RATE', 0)
+        self.profile_dir = config['PROFILE_DIR']
+
+    def wanted(self, environ):
+        token = environ.get(HEADER)
+        if token and self.secret:
+            try:
+                _serializer(self.secret).loads(token, max_age=TOKEN_MAX_AGE)
+                return True
+            except BadSignature:
+                pass
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, environ, start_response):
+        if not self.wanted(environ):
+            return self.wsgi_app(environ, start_response)
+
+        sampler = _Sampler(threading.get_ident(), sys._getframe())
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self.finish(environ, sampler, started)
+            raise
+        return self._profiled(body, environ, sampler, started)
+
+    def _profiled(self, body, environ, sampler, started):
+        # Streamed responses render while they're iterated, so keep
+        # sampling until the server has the whole body.
+        sampler.top = sys._getframe()
+        try:
+            yield from body
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+            self.finish(environ, sampler, started)
+
+    def endpoint(self, environ):
+        try:
+            endpoint, args = self.flask_app.url_map.bind_to_environ(environ).match()
+            return endpoint
+        except Exception:
+            return 'unmatched'
+
+    def finish(self, environ, sampler, started):
+        sampler.stop()
+        elapsed = time.perf_counter() - started
+        endpoint = self.endpoint(environ)
+
+        split = collections.Counter()
+        for stack, count in sampler.stacks.items():
+            split[stack.split(';', 1)[0]] += count
+        total = sum(split.values()) or 1
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{uuid.uuid4().hex[:8]}.folded"
+        with open(os.path.join(self.profile_dir, name), 'w') as f:
+            for stack, count in sorted(sampler.stacks.items()):
+                f.write(f"{endpoint};{stack} {count}\n")
+
+        self.flask_app.logger.info(
+            "Profiled %s %s in %.1f ms (%s): %s", environ['REQUEST_METHOD'],
+            environ.get('PATH_INFO'), elapsed * 1000, name,
+            ', '.join(f"{category} {elapsed * 1000 * split[category] / total:.1f} ms"
+                      for category in ('view', 'sql', 'template')))
+
+
+def init_app(app):
+    """Wrap the app in the profiler, if profiling is configured at all."""
+
+    if app.config.get('PROFILE_SECRET') or app.config.get('PROFILE_SAMPLE_RATE', 0) > 0:
+        app.wsgi_app = Profiler(app.wsgi_app, app)
+
+
+cli = AppGroup('profile', help="Profile requests.")
+
+
+@cli.command('token')
+def token_command():
+    """Print a header value that profiles any request carrying it."""
+
+    secret = current_app.config.get('PROFILE_SECRET')
+    if not secret:
+        raise click.ClickException("Set PROFILE_SECRET first.")
+
+    token = _serializer(secret).dumps('profile')
+    click.echo(f"X-Warbler-Profile: {token}")
+    click.echo(f"(valid for {TOKEN_MAX_AGE // 3600} hours)")
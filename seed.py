@@ -4,6 +4,10 @@ import os
 from dotenv import load_dotenv
 from csv import DictReader
 from app import db, app
+from datetime import datetime
+
+import partitions
+import snowflake
 from models import User, Message, Follows, connect_db
 
 load_dotenv()
@@ -16,8 +20,16 @@ with app.app_context():
     with open('generator/users.csv') as users:
         db.session.bulk_insert_mappings(User, DictReader(users))
 
+    # Give the sample messages ids from their own timestamps, so they sort
+    # the way they would have if they'd been posted live.
     with open('generator/messages.csv') as messages:
-        db.session.bulk_insert_mappings(Message, DictReader(messages))
+        rows = list(DictReader(messages))
+    for i, row in enumerate(rows):
+        at = datetime.fromisoformat(row['timestamp'])
+        row['id'] = snowflake.first_id_at(at) + i % (1 << snowflake.TICK_SHIFT)
+    partitions.ensure(db.session.connection(), start=min(
+        datetime.fromisoformat(row['timestamp']) for row in rows))
+    db.session.bulk_insert_mappings(Message, rows)
 
     with open('generator/follows.csv') as follows:
         db.session.bulk_insert_mappings(Follows, DictReader(follows))
@@ -1,5 +1,20 @@
+"""WSGI entry point for gunicorn.
+
+This is safe to load once in the master with `--preload`: building the app
+opens no database connections and issues no DDL. We compile every template
+here too, so workers fork with them ready. Once it's built we freeze the
+heap, so the garbage collector in forked workers doesn't touch (and copy)
+pages shared with the master.
+"""
+
+import gc
+
+import template_cache
 from app import create_app
 from models import connect_db
 
 app = create_app('warbler')
-connect_db(app)
\ No newline at end of file
+connect_db(app)
+template_cache.compile_all(app)
+
+gc.freeze()
@@ -0,0 +1,167 @@
+"""Log slow SQL statements, with their query plans.
+
+Any statement that takes longer than SLOW_QUERY_MS is written as one JSON
+line to SLOW_QUERY_LOG (rotated at 10 MB). Each line holds the SQL, its
+parameters, the Flask endpoint and request path that ran it, and for
+SELECTs the output of EXPLAIN (ANALYZE, BUFFERS).
+
+ANALYZE runs the statement a second time, so it's only done for SELECTs,
+inside a savepoint so a failure can't break the caller's transaction. A
+savepoint can't undo everything, though: a second pg_notify would still be
+sent, nextval still advances, and FOR UPDATE locks are kept. SELECTs like
+those get a plain EXPLAIN, which doesn't run them.
+Logging is rate limited per process: each distinct statement at most once
+a minute, and no more than SLOW_QUERY_PER_MINUTE lines overall. Set
+SLOW_QUERY_MS=0 to turn it off.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import re
+import threading
+import time
+
+from flask import current_app, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Don't log the same statement more often than this.
+REPEAT_SECONDS = 60
+
+MAX_PARAM_LENGTH = 200
+
+# SELECTs that running again would repeat effects of.
+SIDE_EFFECTS = re.compile(
+    r'\b(pg_notify|nextval|setval|pg_advisory_\w+)\s*\('
+    r'|\bFOR\s+(NO\s+KEY\s+)?(UPDATE|SHARE)\b'
+    r'|\bFOR\s+KEY\s+SHARE\b',
+    re.IGNORECASE)
+
+
+class SlowQueryLog:
+    """Decides what to log for one app, and writes it."""
+
+    def __init__(self, path, threshold_ms, per_minute, explain=True):
+        self.threshold = threshold_ms / 1000
+        self.per_minute = per_minute
+        self.explain = explain
+        self.lock = threading.Lock()
+        self.last_logged = {}
+        self.window_start = 0
+        self.window_count = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.logger = logging.getLogger(f'warbler.slow_queries.{path}')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        if not self.logger.handlers:
+            handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=10 * 1024 * 1024, backupCount=5)
+            self.logger.addHandler(handler)
+
+    def allow(self, statement):
+        """Rate limit: is this statement due to be logged now?"""
+
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_logged.get(statement, -REPEAT_SECONDS) < REPEAT_SECONDS:
+                return False
+            if now - self.window_start >= 60:
+                self.window_start, self.window_count = now, 0
+            if self.window_count >= self.per_minute:
+                return False
+
+            self.window_count += 1
+            self.last_logged[statement] = now
+            if len(self.last_logged) > 1000:
+                self.last_logged = {sql: at for sql, at in self.last_logged.items()
+                                    if now - at < REPEAT_SECONDS}
+            return True
+
+    def record(self, cursor, statement, parameters, elapsed, executemany):
+        entry = {
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'ms': round(elapsed * 1000, 1),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'path': request.full_path if has_request_context() else None,
+            'sql': statement,
+            'params': _loggable(statement, parameters),
+        }
+
+        if self.explain and not executemany and statement.lstrip()[:6].upper() == 'SELECT':
+            analyze = not SIDE_EFFECTS.search(statement)
+            entry['plan'] = _explain(cursor, statement, parameters, analyze)
+
+        self.logger.info(json.dumps(entry, default=str))
+
+
+def _loggable(statement, parameters):
+    if 'password' in statement.lower():
+        return '<redacted>'
+    if isinstance(parameters, dict):
+        return {key: _truncate(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_truncate(value) for value in parameters]
+    return _truncate(parameters)
+
+
+def _truncate(value):
+    text = repr(value)
+    return text if len(text) <= MAX_PARAM_LENGTH else text[:MAX_PARAM_LENGTH] + '...'
+
+
+def _explain(cursor, statement, parameters, analyze=True):
+    """EXPLAIN (ANALYZE) on the same connection, without disturbing it."""
+
+    options = "(ANALYZE, BUFFERS) " if analyze else ""
+
+    dbapi_cursor = cursor.connection.cursor()
+    try:
+        dbapi_cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            dbapi_cursor.execute("EXPLAIN " + options + statement, parameters)
+            plan = '\n'.join(row[0] for row in dbapi_cursor.fetchall())
+        except Exception as e:
+            dbapi_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            plan = f"EXPLAIN failed: {e}"
+        dbapi_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        return plan
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        dbapi_cursor.close()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'handle_error')
+def _drop_timer(context):
+    started = context.connection.info.get('query_started') if context.connection else None
+    if started:
+        started.pop()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _check_elapsed(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+
+    if not has_app_context():
+        return
+    log = current_app.extensions.get('slow_queries')
+    if log and elapsed >= log.threshold and log.allow(statement):
+        log.record(cursor, statement, parameters, elapsed, executemany)
+
+
+def init_app(app):
+    """Start logging slow statements for `app`, unless SLOW_QUERY_MS is 0."""
+
+    threshold = app.config['SLOW_QUERY_MS']
+    if threshold > 0:
+        app.extensions['slow_queries'] = SlowQueryLog(
+            app.config['SLOW_QUERY_LOG'], threshold,
+            app.config['SLOW_QUERY_PER_MINUTE'], app.config['SLOW_QUERY_EXPLAIN'])
@@ -0,0 +1,120 @@
+""""Who to follow" suggestions, precomputed from the follow graph.
+
+A user's suggestions are the people followed by the people they follow,
+ranked by how many of those mutual follows there are. They're computed in
+SQL and stored in `follow_suggestions`, so the home page sidebar only reads
+a few rows and never walks the graph.
+
+`flask suggestions rebuild` recomputes everyone. After that, follows and
+unfollows queue jobs that recompute just the users whose friends-of-friends
+changed.
+"""
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from sqlalchemy.orm import load_only
+
+import jobs
+from models import db, User, FollowSuggestion
+
+# Suggestions kept per user.
+PER_USER = 20
+
+# Recompute suggestions for the user ids selected by the {users} subquery.
+REFRESH_SQL = """
+    INSERT INTO follow_suggestions (user_id, suggested_user_id, mutual_count)
+    SELECT user_id, suggested_user_id, mutual_count FROM (
+        SELECT f1.user_following_id AS user_id,
+               f2.user_being_followed_id AS suggested_user_id,
+               count(*) AS mutual_count,
+               row_number() OVER (
+                   PARTITION BY f1.user_following_id
+                   ORDER BY count(*) DESC, f2.user_being_followed_id
+               ) AS rank
+        FROM follows f1
+        JOIN follows f2 ON f2.user_following_id = f1.user_being_followed_id
+        JOIN users u ON u.id = f2.user_being_followed_id AND u.deleted_at IS NULL
+        WHERE f1.user_following_id IN ({users})
+          AND f2.user_being_followed_id <> f1.user_following_id
+          AND NOT EXISTS (
+              SELECT 1 FROM follows already
+              WHERE already.user_following_id = f1.user_following_id
+                AND already.user_being_followed_id = f2.user_being_followed_id)
+        GROUP BY f1.user_following_id, f2.user_being_followed_id
+    ) ranked
+    WHERE rank <= :per_user
+"""
+
+
+def refresh(users_sql, **params):
+    """Recompute suggestions for the user ids selected by `users_sql`."""
+
+    db.session.execute(
+        text(f"DELETE FROM follow_suggestions WHERE user_id IN ({users_sql})"),
+        params)
+    db.session.execute(
+        text(REFRESH_SQL.format(users=users_sql)), {'per_user': PER_USER, **params})
+
+
+def rebuild():
+    """Recompute suggestions for every user."""
+
+    refresh("SELECT id FROM users")
+
+
+@jobs.job()
+def refresh_user_suggestions(user_id):
+    """Recompute suggestions for one user."""
+
+    refresh("SELECT :uid", uid=user_id)
+
+
+@jobs.job()
+def refresh_follower_suggestions(user_id):
+    """Recompute suggestions for everyone who follows `user_id`."""
+
+    refresh("SELECT user_following_id FROM follows WHERE user_being_followed_id = :uid",
+            uid=user_id)
+
+
+def on_follow_changed(follower_id, followed_id):
+    """Queue the refreshes needed after `follower_id` (un)follows someone.
+
+    The follower's own friends-of-friends changed, and so did those of
+    everyone who follows the follower.
+    """
+
+    FollowSuggestion.query.filter_by(
+        user_id=follower_id, suggested_user_id=followed_id).delete()
+
+    jobs.enqueue('refresh_user_suggestions',
+                 dedupe_key=f'refresh_user_suggestions:{follower_id}',
+                 user_id=follower_id)
+    jobs.enqueue('refresh_follower_suggestions',
+                 dedupe_key=f'refresh_follower_suggestions:{follower_id}',
+                 user_id=follower_id)
+
+
+def suggestions_for(user, limit=5):
+    """The top `limit` suggested users for `user`."""
+
+    return (User.query
+            .join(FollowSuggestion, FollowSuggestion.suggested_user_id == User.id)
+            .filter(FollowSuggestion.user_id == user.id)
+            .order_by(FollowSuggestion.mutual_count.desc())
+            .options(load_only(User.id, User.username, User.image_url))
+            .limit(limit)
+            .all())
+
+
+cli = AppGroup('suggestions', help="Maintain follow suggestions.")
+
+
+@cli.command('rebuild')
+def rebuild_command():
+    """Recompute follow suggestions for every user."""
+
+    rebuild()
+    db.session.commit()
+    click.echo("Rebuilt follow suggestions.")
@@ -0,0 +1,60 @@
+"""Compiled templates, shared across workers and deploys.
+
+Jinja compiles each template to Python the first time it's used. With
+JINJA_CACHE_DIR set, the compiled code is also written there (keyed on a
+checksum of the source, so edits are picked up) and later processes load it
+instead of compiling again.
+
+`flask templates compile` fills the cache as a build step. server.py also
+loads every template in the gunicorn master before it forks, so workers
+start with them compiled in memory and serve their first page at full speed.
+
+Each load from the cache counts as a hit or miss of the `jinja_bytecode`
+cache in /metrics (see metrics.py).
+"""
+
+import os
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+
+import metrics
+
+
+class CountingBytecodeCache(FileSystemBytecodeCache):
+    """FileSystemBytecodeCache that reports its hits and misses."""
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        metrics.cache_lookup('jinja_bytecode', bucket.code is not None)
+
+
+def init_app(app):
+    """Cache compiled templates in JINJA_CACHE_DIR, if it's set."""
+
+    path = app.config.get('JINJA_CACHE_DIR')
+    if path:
+        os.makedirs(path, exist_ok=True)
+        app.jinja_env.bytecode_cache = CountingBytecodeCache(path)
+
+
+def compile_all(app):
+    """Load every template, compiling (and caching) any that need it."""
+
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
+cli = AppGroup('templates', help="Manage compiled templates.")
+
+
+@cli.command('compile')
+def compile_command():
+    """Precompile all templates into JINJA_CACHE_DIR."""
+
+    names = compile_all(current_app)
+    click.echo(f"Compiled {len(names)} templates.")
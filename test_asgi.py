@@ -0,0 +1,91 @@
+"""Async (Quart) app tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_asgi.py
+
+
+from unittest import IsolatedAsyncioTestCase
+
+import markup
+import uploads
+from app import create_app, CURR_USER_KEY
+from asgi import create_async_app
+from models import db, connect_db, Follows, Likes, Message, User
+
+flask_app = create_app('postgresql:///warbler-test', testing=True)
+flask_app.config['SQLALCHEMY_ECHO'] = False
+connect_db(flask_app)
+
+app = create_async_app('warbler-test')
+
+
+class AsgiTestCase(IsolatedAsyncioTestCase):
+    """Render the async app's pages through the Quart test client."""
+
+    def setUp(self):
+        with flask_app.app_context():
+            db.drop_all()
+            db.create_all()
+
+            reader = User(username="reader", email="reader@test.com", password="hashed")
+            writer = User(username="writer", email="writer@test.com", password="hashed")
+            db.session.add_all([reader, writer])
+            db.session.flush()
+
+            message = Message(text="hello #world", user_id=writer.id)
+            db.session.add(message)
+            db.session.flush()
+
+            db.session.add_all([
+                Follows(user_following_id=reader.id, user_being_followed_id=writer.id),
+                Likes(user_id=reader.id, message_id=message.id),
+            ])
+            db.session.commit()
+
+            self.reader_id, self.writer_id = reader.id, writer.id
+
+    async def get(self, path, logged_in=True):
+        # test_app runs startup and shutdown, so each test's event loop gets
+        # its own connections.
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            if logged_in:
+                async with client.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.reader_id
+            resp = await client.get(path)
+            return resp.status_code, await resp.get_data(as_text=True)
+
+    async def test_anon_homepage(self):
+        status, html = await self.get('/', logged_in=False)
+
+        self.assertEqual(status, 200)
+        self.assertIn('/static/stylesheets/style.css', html)
+
+    async def test_homepage(self):
+        status, html = await self.get('/')
+
+        self.assertEqual(status, 200)
+        self.assertIn('<a href="/tags/world">#world</a>', html)
+        self.assertIn(f'<a href="/users/{self.reader_id}/following">1</a>', html)
+
+    async def test_users_show(self):
+        status, html = await self.get(f'/users/{self.writer_id}')
+
+        self.assertEqual(status, 200)
+        self.assertIn('@writer', html)
+        self.assertIn('#world', html)
+        self.assertIn(f'<a href="/users/{self.writer_id}">1</a>', html)
+        self.assertIn(f'<a href="/users/{self.writer_id}/followers">1</a>', html)
+        self.assertIn('Unfollow', html)
+
+    async def test_liked_messages(self):
+        status, html = await self.get(f'/users/{self.reader_id}/liked-messages')
+
+        self.assertEqual(status, 200)
+        self.assertIn('hello', html)
+        self.assertNotIn('Older', html)
+
+    def test_template_filters(self):
+        self.assertIs(app.jinja_env.filters['thumb'], uploads.thumb)
+        self.assertIs(app.jinja_env.filters['linkify'], markup.linkify)
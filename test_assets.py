@@ -0,0 +1,106 @@
+"""Static asset pipeline tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_assets.py
+
+
+import os
+import tempfile
+from unittest import TestCase
+
+import assets
+from app import create_app
+
+app = create_app('postgresql:///warbler-test', testing=True)
+
+
+class AssetBuildTestCase(TestCase):
+    """Test fingerprinting and serving built assets."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.static = os.path.join(self.dir.name, 'static')
+        self.dist = os.path.join(self.static, 'dist')
+
+        os.makedirs(os.path.join(self.static, 'stylesheets'))
+        os.makedirs(os.path.join(self.static, 'images'))
+        with open(os.path.join(self.static, 'images', 'bg.png'), 'wb') as f:
+            f.write(b'\x89PNG fake image')
+        with open(os.path.join(self.static, 'stylesheets', 'style.css'), 'w') as f:
+            f.write("/* site styles */\n"
+                    ".hero {\n  background: url('../images/bg.png');\n}\n"
+                    ".nav {\n  background: url(\"/static/images/bg.png\");\n  color: red;\n}\n"
+                    + ".pad { margin: 0; }\n" * 50)
+
+        self.manifest = assets.build(self.static, self.dist)
+
+    def tearDown(self):
+        self.dir.cleanup()
+        app.extensions.pop('assets', None)
+
+    def test_build(self):
+        css_name = self.manifest['stylesheets/style.css']
+        png_name = self.manifest['images/bg.png']
+
+        self.assertRegex(css_name, r'^stylesheets/style\.[0-9a-f]{12}\.css$')
+        self.assertTrue(os.path.exists(os.path.join(self.dist, css_name + '.gz')))
+
+        with open(os.path.join(self.dist, css_name)) as f:
+            css = f.read()
+
+        self.assertNotIn("site styles", css)
+        self.assertEqual(css.count(f'url("/assets/{png_name}")'), 2)
+
+    def test_serve(self):
+        app.config['ASSETS_DIST'] = self.dist
+        css_name = self.manifest['stylesheets/style.css']
+
+        with app.test_request_context():
+            self.assertEqual(assets.asset_url('stylesheets/style.css'),
+                             f"/assets/{css_name}")
+
+        with app.test_client() as c:
+            resp = c.get(f"/assets/{css_name}", headers={"Accept-Encoding": "gzip"})
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(resp.mimetype, 'text/css')
+            self.assertIn('immutable', resp.headers['Cache-Control'])
+
+
+class VendorTestCase(TestCase):
+    """Test the pinned third-party files."""
+
+    def test_committed_files_match_pins(self):
+        missing = assets.verify_vendor(app.static_folder)
+
+        self.assertNotIn('vendor/jquery/jquery.min.js', missing)
+        self.assertNotIn('vendor/fontawesome/css/all.min.css', missing)
+
+        # Nothing is ever loaded from a CDN, committed or not.
+        with app.test_request_context():
+            for path in assets.VENDOR:
+                self.assertEqual(assets.asset_url(path), f"/static/{path}")
+
+    def test_build_fails_without_vendor_files(self):
+        static_folder = app.static_folder
+        with tempfile.TemporaryDirectory() as static:
+            app.static_folder = static
+            try:
+                result = app.test_cli_runner().invoke(args=['assets', 'build'])
+            finally:
+                app.static_folder = static_folder
+
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn('vendor/bootstrap/bootstrap.min.css', result.output)
+
+    def test_tampered_file(self):
+        with tempfile.TemporaryDirectory() as static:
+            path = os.path.join(static, 'vendor', 'jquery', 'jquery.min.js')
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write("alert('not jquery')")
+
+            with self.assertRaises(ValueError):
+                assets.verify_vendor(static)
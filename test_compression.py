@@ -0,0 +1,96 @@
+"""Response compression tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_compression.py
+
+
+import gzip
+import zlib
+from unittest import TestCase
+
+from flask import Flask, Response
+
+import compression
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route('/big')
+    def big():
+        return '<p>warble</p>' * 200
+
+    @app.route('/tagged')
+    def tagged():
+        return Response('<p>warble</p>' * 200, headers={'ETag': '"v1"'})
+
+    @app.route('/small')
+    def small():
+        return 'tiny'
+
+    @app.route('/image')
+    def image():
+        return Response(b'\x89PNG' * 500, mimetype='image/png')
+
+    @app.route('/stream')
+    def stream():
+        return Response((f'data: {i}\n\n' for i in range(3)), mimetype='text/event-stream')
+
+    app.wsgi_app = compression.Compress(app.wsgi_app)
+    return app
+
+
+class CompressionTestCase(TestCase):
+    """Test negotiation, skipping and streaming."""
+
+    def setUp(self):
+        self.client = make_app().test_client()
+
+    def test_gzip(self):
+        resp = self.client.get('/big', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(resp.headers['Content-Length']), len(resp.data))
+        self.assertEqual(gzip.decompress(resp.data), b'<p>warble</p>' * 200)
+
+    def test_etag_weakened(self):
+        resp = self.client.get('/tagged', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['ETag'], 'W/"v1"')
+
+        resp = self.client.get('/tagged')
+        self.assertEqual(resp.headers['ETag'], '"v1"')
+
+    def test_brotli_preferred(self):
+        if compression.brotli is None:
+            self.skipTest('brotli not installed')
+
+        resp = self.client.get('/big', headers={'Accept-Encoding': 'gzip, deflate, br'})
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(resp.data), b'<p>warble</p>' * 200)
+
+    def test_skipped(self):
+        for path in ('/small', '/image'):
+            resp = self.client.get(path, headers={'Accept-Encoding': 'gzip'})
+            self.assertNotIn('Content-Encoding', resp.headers)
+
+        resp = self.client.get('/big')
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+        resp = self.client.get('/big', headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+    def test_stream(self):
+        resp = self.client.get('/stream', headers={'Accept-Encoding': 'gzip'},
+                               buffered=False)
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', resp.headers)
+
+        # Each event arrives decodable on its own, before the stream ends.
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = [decoder.decompress(c) for c in resp.response]
+        self.assertEqual(chunks[:3], [b'data: 0\n\n', b'data: 1\n\n', b'data: 2\n\n'])
+        resp.close()
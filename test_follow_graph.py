@@ -0,0 +1,105 @@
+"""Follow graph index tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_follow_graph.py
+
+
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from app import create_app
+import follow_graph
+from models import db, connect_db, User, Follows
+
+app = create_app('postgresql:///warbler-test', testing=True)
+connect_db(app)
+
+
+class FollowGraphTestCase(TestCase):
+    """Test the memory-mapped follow graph and its deltas."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'graph.bin')
+
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+            self.ids = []
+            for i in range(4):
+                user = User.signup(f"user{i}", f"user{i}@test.com", "password", None)
+                db.session.commit()
+                self.ids.append(user.id)
+
+            a, b, c, d = self.ids
+            for follower, followed in [(a, b), (a, c), (b, c), (c, a)]:
+                db.session.add(Follows(user_following_id=follower,
+                                       user_being_followed_id=followed))
+            db.session.commit()
+
+            with db.engine.connect() as connection:
+                follow_graph.build(self.path, connection)
+
+    def tearDown(self):
+        self.dir.cleanup()
+        with app.app_context():
+            db.session.rollback()
+
+    def test_queries(self):
+        a, b, c, d = self.ids
+        graph = follow_graph.FollowGraph(self.path)
+
+        self.assertTrue(graph.follows(a, b))
+        self.assertFalse(graph.follows(b, a))
+        self.assertTrue(graph.is_mutual(a, c))
+        self.assertEqual(graph.followers_count(c), 2)
+        self.assertEqual(graph.following_count(a), 2)
+        self.assertEqual(graph.following_count(d), 0)
+        self.assertEqual(list(graph.common_following(a, b)), [c])
+
+    def test_build_sizes_from_edges(self):
+        """Is a user who signed up between the two reads still indexed?"""
+
+        a, b, c, d = self.ids
+        new = d + 1
+        connection = mock.Mock()
+        connection.execute.side_effect = [
+            mock.Mock(scalar=mock.Mock(return_value=new)),
+            mock.Mock(fetchall=mock.Mock(return_value=[(new, a), (a, b)])),
+        ]
+        follow_graph.build(self.path, connection)
+        graph = follow_graph.FollowGraph(self.path)
+
+        self.assertTrue(graph.follows(new, a))
+        self.assertEqual(graph.following_count(new), 1)
+        self.assertEqual(graph.followers_count(a), 1)
+
+    def test_deltas(self):
+        a, b, c, d = self.ids
+        graph = follow_graph.FollowGraph(self.path)
+
+        follow_graph.append_deltas(self.path, [
+            (follow_graph.FOLLOW, d, a),
+            (follow_graph.UNFOLLOW, a, b),
+            # replaying an existing edge changes nothing
+            (follow_graph.FOLLOW, a, c),
+        ])
+        graph._refresh(force=True)
+
+        self.assertTrue(graph.follows(d, a))
+        self.assertFalse(graph.follows(a, b))
+        self.assertEqual(graph.followers_count(a), 2)
+        self.assertEqual(graph.following_count(a), 1)
+        self.assertEqual(list(graph.following(a)), [c])
+
+        # A rebuild starts over from the database, past the logged deltas
+        with app.app_context():
+            with db.engine.connect() as connection:
+                follow_graph.build(self.path, connection)
+        graph._refresh(force=True)
+
+        self.assertTrue(graph.follows(a, b))
+        self.assertFalse(graph.follows(d, a))
@@ -0,0 +1,93 @@
+"""Background job tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_jobs.py
+
+
+from datetime import datetime, timedelta
+from app import create_app
+from unittest import TestCase
+
+import jobs
+from models import db, connect_db, Job, User
+
+app = create_app('postgresql:///warbler-test', testing=True)
+connect_db(app)
+
+calls = []
+
+
+@jobs.job()
+def record_call(value):
+    calls.append(value)
+
+
+@jobs.job(max_attempts=2)
+def always_fails(username):
+    User.signup(username, f"{username}@test.com", "password", None)
+    raise RuntimeError("boom")
+
+
+class JobTestCase(TestCase):
+    """Test queueing and running jobs."""
+
+    def setUp(self):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+        calls.clear()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.rollback()
+
+    def test_run_job(self):
+        with app.app_context():
+            jobs.enqueue('record_call', value=7)
+            db.session.commit()
+
+            self.assertTrue(jobs.run_one())
+            self.assertFalse(jobs.run_one())
+
+            self.assertEqual(calls, [7])
+            self.assertEqual(Job.query.count(), 0)
+
+    def test_run_at_is_utc(self):
+        with app.app_context():
+            # Whatever the server's zone, default and scheduled times agree.
+            db.session.execute(db.text("SET LOCAL TIME ZONE 'Pacific/Auckland'"))
+            jobs.enqueue('record_call', value=1)
+            jobs.enqueue('record_call', run_at=datetime.utcnow() + timedelta(hours=1), value=2)
+
+            self.assertEqual([job.payload['value'] for job in Job.query.order_by(Job.run_at)],
+                             [1, 2])
+            self.assertEqual(Job.query.filter(Job.run_at <= jobs.utc_now()).count(), 1)
+
+    def test_dedupe_key(self):
+        with app.app_context():
+            jobs.enqueue('record_call', dedupe_key='once', value=1)
+            jobs.enqueue('record_call', dedupe_key='once', value=2)
+            db.session.commit()
+
+            self.assertEqual(Job.query.count(), 1)
+
+    def test_failed_job_retries_then_fails(self):
+        with app.app_context():
+            jobs.enqueue('always_fails', username='ghost')
+            db.session.commit()
+
+            self.assertTrue(jobs.run_one())
+
+            job = Job.query.one()
+            self.assertEqual(job.status, 'pending')
+            self.assertEqual(job.attempts, 1)
+            self.assertIn("boom", job.last_error)
+            # The handler's changes were rolled back
+            self.assertEqual(User.query.count(), 0)
+
+            job.run_at = datetime.utcnow()
+            db.session.commit()
+            jobs.run_one()
+
+            self.assertEqual(Job.query.one().status, 'failed')
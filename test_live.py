@@ -0,0 +1,107 @@
+"""Live update broker tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_live.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import create_engine, make_url, text
+
+import live
+from live import Broker, CHANNEL, OVERFLOW, event_stream, notifications
+
+
+class BrokerTestCase(TestCase):
+    """Test fan-out and backpressure of live updates."""
+
+    def test_only_followed_authors(self):
+        broker = Broker()
+        sub = broker.subscribe([1, 2])
+
+        broker.publish({'id': 10, 'user_id': 1})
+        broker.publish({'id': 11, 'user_id': 3})
+
+        self.assertEqual(sub.next_event(0), {'id': 10, 'user_id': 1})
+        self.assertIsNone(sub.next_event(0))
+
+    def test_unsubscribe(self):
+        broker = Broker()
+        sub = broker.subscribe([1])
+        broker.unsubscribe(sub)
+
+        broker.publish({'id': 10, 'user_id': 1})
+
+        self.assertIsNone(sub.next_event(0))
+
+    def test_slow_client_overflows(self):
+        broker = Broker()
+        sub = broker.subscribe([1])
+
+        for i in range(sub._maxsize + 1):
+            broker.publish({'id': i, 'user_id': 1})
+
+        self.assertTrue(sub.overflowed)
+        self.assertIs(sub.next_event(0), OVERFLOW)
+
+    def test_limit(self):
+        broker = Broker()
+        sub = broker.subscribe([1], limit=1)
+
+        self.assertIsNone(broker.subscribe([1], limit=1))
+
+        broker.unsubscribe(sub)
+        self.assertIsNotNone(broker.subscribe([1], limit=1))
+
+
+class EventStreamTestCase(TestCase):
+    """Test replaying missed events and ending long streams."""
+
+    def test_replay_then_live(self):
+        sub = live.broker.subscribe([1])
+        sub.offer({'id': 10, 'user_id': 1})
+        sub.offer({'id': 11, 'user_id': 1})
+
+        frames = event_stream(sub, replay=[{'id': 10, 'user_id': 1}], max_seconds=0.1)
+
+        ids = [frame.split('\n')[0] for frame in frames if frame.startswith('id:')]
+        self.assertEqual(ids, ['id: 10', 'id: 11'])
+
+    def test_ends_after_max_seconds(self):
+        sub = live.broker.subscribe([1])
+
+        frames = list(event_stream(sub, max_seconds=0.1))
+
+        self.assertEqual(frames[0], f"retry: {live.RETRY_MS}\n\n")
+        self.assertNotIn(sub, live.broker._subscriptions)
+
+
+class NotificationsTestCase(TestCase):
+    """Test receiving NOTIFYs with both PostgreSQL drivers."""
+
+    def check_driver(self, driver):
+        url = make_url(os.environ.get('DATABASE_URL', 'postgresql:///warbler-test'))
+        engine = create_engine(url.set(drivername=f'postgresql+{driver}'))
+
+        conn = engine.raw_connection().dbapi_connection
+        try:
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {CHANNEL}")
+
+            with engine.begin() as sender:
+                sender.execute(text("SELECT pg_notify(:channel, 'hi')"), {'channel': CHANNEL})
+
+            payloads = notifications(conn)
+            self.assertEqual(next(payloads), 'hi')
+            payloads.close()
+        finally:
+            conn.close()
+            engine.dispose()
+
+    def test_psycopg2(self):
+        self.check_driver('psycopg2')
+
+    def test_psycopg(self):
+        self.check_driver('psycopg')
@@ -0,0 +1,55 @@
+"""Per-endpoint memory tracing tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_memtrace.py
+
+
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import memtrace
+from app import create_app
+from models import db, connect_db, User
+
+app = create_app('postgresql:///warbler-test', testing=True)
+app.config['SQLALCHEMY_ECHO'] = False
+connect_db(app)
+
+
+class MemtraceTestCase(TestCase):
+    """Test sampling a request's memory use."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'memtrace.log')
+        app.config.update(MEMTRACE_SAMPLE_RATE=1.0, MEMTRACE_LOG=self.path)
+        memtrace.init_app(app)
+
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            db.session.add_all([User(username=f"user{i}", email=f"user{i}@test.com",
+                                     password="hashed") for i in range(300)])
+            db.session.commit()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_list_users(self):
+        resp = app.test_client().get('/users')
+        self.assertEqual(resp.status_code, 200)
+
+        with open(self.path) as f:
+            [entry] = [json.loads(line) for line in f]
+
+        self.assertEqual(entry['endpoint'], 'list_users')
+        self.assertGreater(entry['peak'], 100_000)
+        self.assertTrue(any(site['site'].startswith('app.py:') for site in entry['app_sites']))
+
+        with open(self.path) as f:
+            [stats] = memtrace.report(f)
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['max_peak'], entry['peak'])
@@ -7,8 +7,12 @@
 
 import os
 from unittest import TestCase
+from unittest.mock import patch
 
-from models import db, User, Message, Follows
+import markup
+import models
+import snowflake
+from models import db, connect_db, User, Message, MessageTag, Follows
 from datetime import datetime
 
 # BEFORE we import our app, let's set an environmental variable
@@ -24,6 +28,7 @@ from datetime import datetime
 from app import create_app
 
 app = create_app('postgresql:///warbler-test', testing=True)
+connect_db(app)
 
 # Create our tables (we do this here, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
@@ -75,8 +80,51 @@ class MessageModelTestCase(TestCase):
 
             # checks if the message is added to the user model successfully
             self.assertEqual(len(u.messages), 1)
-            # checks if the message was in fact created in the db
-            self.assertEqual(message.id, 1)
+            # checks if the message was in fact created in the db, with an
+            # id made from the time it was posted
+            self.assertEqual(Message.query.get(message.id).text, 'THIS IS A TEST!')
+            made = snowflake.timestamp_of(message.id)
+            self.assertLess(abs((datetime.utcnow() - made).total_seconds()), 60)
+
+    def test_message_ids_ordered(self):
+        """Are message ids unique and increasing in the order they're made?"""
+
+        ids = [snowflake.first_id_at(datetime(2024, 7, 7))]
+        with app.app_context():
+            ids += [models.message_ids.next_id() for _ in range(500)]
+
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertLess(ids[-1], 2 ** 53)
+        self.assertEqual(snowflake.timestamp_of(ids[0]), datetime(2024, 7, 7))
+
+    def test_message_id_worker_leases(self):
+        """Does each live process get its own worker number?"""
+
+        with app.app_context():
+            first = models._lease_message_id_worker()
+            with patch('models._message_id_holder', return_value='elsewhere:1'):
+                second = models._lease_message_id_worker()
+                self.assertNotEqual(first, second)
+                self.assertFalse(models._renew_message_id_worker(first))
+                self.assertTrue(models._renew_message_id_worker(second))
+
+            # An expired lease is handed out again.
+            models.MessageIdLease.query.filter_by(worker=first).update(
+                {'expires_at': datetime(2020, 1, 1)})
+            db.session.commit()
+            self.assertEqual(models._lease_message_id_worker(), first)
+
+    def test_lost_worker_lease(self):
+        """Does the generator stop using a worker number it no longer holds?"""
+
+        workers = iter([1, 2])
+        generator = snowflake.IdGenerator(lambda: next(workers), lambda worker: False,
+                                          renew_every=0)
+
+        first, second = generator.next_id(), generator.next_id()
+
+        self.assertEqual((first >> snowflake.SEQUENCE_BITS) & 0xff, 1)
+        self.assertEqual((second >> snowflake.SEQUENCE_BITS) & 0xff, 2)
 
     def test_message_delete_cascase(self):
         """When a user is deleted, does this in turn also delete any message(s) tied to that user?"""
@@ -149,4 +197,43 @@ class MessageModelTestCase(TestCase):
             created_message = Message.query.filter_by(user_id=u.id).first()
             self.assertIsNone(created_message)
 
-    
\ No newline at end of file
+    def test_casefolded_tag_fits(self):
+        """A tag that grows when casefolded still fits the tag column."""
+        tag = 'ß' * 50
+
+        with app.app_context():
+            u = User(username='german', email='german@email.com', password='password')
+            db.session.add(u)
+            db.session.flush()
+
+            message = Message(text=f'#{tag}', user_id=u.id)
+            db.session.add(message)
+            db.session.flush()
+            db.session.add_all(MessageTag.for_message(message))
+            db.session.commit()
+
+            self.assertEqual([t.tag for t in MessageTag.query], ['ss' * 25])
+            messages, _ = MessageTag.timeline(tag)
+            self.assertEqual([m.id for m in messages], [message.id])
+
+    def test_long_tag_truncated(self):
+        """A tag longer than TAG_LENGTH is stored and linked cut down to it."""
+        tag = 'a' * 60
+
+        with app.app_context():
+            u = User(username='verbose', email='verbose@email.com', password='password')
+            db.session.add(u)
+            db.session.flush()
+
+            message = Message(text=f'so #{tag}!', user_id=u.id)
+            db.session.add(message)
+            db.session.flush()
+            db.session.add_all(MessageTag.for_message(message))
+            db.session.commit()
+
+            self.assertEqual([t.tag for t in MessageTag.query], ['a' * 50])
+            messages, _ = MessageTag.timeline(tag)
+            self.assertEqual([m.id for m in messages], [message.id])
+
+        self.assertEqual(markup.linkify(f'so #{tag}!'),
+                         f'so <a href="/tags/{"a" * 50}">#{tag}</a>!')
@@ -6,9 +6,11 @@
 
 
 import os
+from datetime import datetime
 from unittest import TestCase
 
-from models import db, connect_db, Message, User
+import trending
+from models import db, connect_db, Follows, Job, Message, MessageTag, Notification, User, TrendingMessage
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -20,9 +22,10 @@ from models import db, connect_db, Message, User
 
 # Now we can import app
 
-from app import create_app, CURR_USER_KEY
+from app import create_app, CURR_USER_KEY, SINCE_LIMIT
 
 app = create_app('postgresql:///warbler-test', testing=True)
+connect_db(app)
 
 # Create our tables (we do this here, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
@@ -74,3 +77,198 @@ class MessageViewTestCase(TestCase):
 
                 msg = Message.query.one()
                 self.assertEqual(msg.text, "Hello")
+
+    def test_messages_since(self):
+        """Does a profile refresh return only newer messages and deletions?"""
+        with app.app_context():
+            old = Message(id=100, text="old news", user_id=self.testuser_id)
+            new = Message(id=200, text="hot off the press", user_id=self.testuser_id)
+            db.session.add_all([old, new])
+            db.session.commit()
+
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.testuser_id
+
+                resp = c.get(f"/messages/since?user_id={self.testuser_id}&after=100")
+                data = resp.get_json()
+
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual([m['id'] for m in data['messages']], [200])
+                self.assertEqual(data['after'], 200)
+                self.assertFalse(data['more'])
+                self.assertEqual(data['deleted'], [])
+
+                cursor = data['deleted_after']
+                c.post("/messages/100/delete")
+
+                resp = c.get(f"/messages/since?user_id={self.testuser_id}"
+                             f"&after=200&deleted_after={cursor}")
+                data = resp.get_json()
+
+                self.assertEqual(data['messages'], [])
+                self.assertEqual(data['deleted'], [100])
+
+    def test_messages_since_pages(self):
+        """Does a long gap come back in order, a page at a time?"""
+        with app.app_context():
+            db.session.add_all([Message(id=i, text=f"msg {i}", user_id=self.testuser_id)
+                                for i in range(1, SINCE_LIMIT + 6)])
+            db.session.commit()
+
+        resp = self.client.get(f"/messages/since?user_id={self.testuser_id}&after=0")
+        data = resp.get_json()
+
+        self.assertEqual([m['id'] for m in data['messages']], list(range(1, SINCE_LIMIT + 1)))
+        self.assertEqual(data['after'], SINCE_LIMIT)
+        self.assertTrue(data['more'])
+
+        resp = self.client.get(f"/messages/since?user_id={self.testuser_id}&after={data['after']}")
+        data = resp.get_json()
+
+        self.assertEqual([m['id'] for m in data['messages']],
+                         list(range(SINCE_LIMIT + 1, SINCE_LIMIT + 6)))
+        self.assertFalse(data['more'])
+
+    def test_stream_replay(self):
+        """Does a reconnecting stream get what it missed, then end?"""
+        with app.app_context():
+            writer = User(username="writer", email="writer@test.com", password="hashed")
+            db.session.add(writer)
+            db.session.flush()
+            db.session.add(Follows(user_following_id=self.testuser_id,
+                                   user_being_followed_id=writer.id))
+            db.session.add_all([Message(id=100, text="seen", user_id=writer.id),
+                                Message(id=200, text="missed", user_id=writer.id)])
+            db.session.commit()
+
+        app.config['LIVE_STREAM_SECONDS'] = 0
+        try:
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.testuser_id
+
+                resp = c.get("/messages/stream", headers={'Last-Event-ID': '100'})
+                body = resp.get_data(as_text=True)
+        finally:
+            app.config['LIVE_STREAM_SECONDS'] = 300
+
+        self.assertIn("id: 200", body)
+        self.assertIn("missed", body)
+        self.assertNotIn("id: 100", body)
+
+    def test_trending(self):
+        """Do likes show up on the trending page once it's refreshed?"""
+        with app.app_context():
+            other = User.signup("fan", "fan@test.com", "password", None)
+            db.session.add(Message(id=300, text="going viral", user_id=self.testuser_id))
+            db.session.commit()
+
+            for user_id in [self.testuser_id, other.id]:
+                with self.client as c:
+                    with c.session_transaction() as sess:
+                        sess[CURR_USER_KEY] = user_id
+                    c.post("/users/add-like/300", headers={"Referer": "/"})
+
+            trending.refresh()
+            db.session.commit()
+
+            resp = self.client.get("/messages/trending")
+            self.assertIn("going viral", str(resp.data))
+
+            top = TrendingMessage.query.one()
+            self.assertEqual(top.message_id, 300)
+            self.assertAlmostEqual(top.score, 2 / 24)
+
+            # The job keeps itself going with no likes to prompt it.
+            Job.query.delete()
+            trending.refresh_job()
+            self.assertEqual(Job.query.filter_by(kind='refresh_trending').count(), 1)
+
+    def test_tag_timeline(self):
+        """Are #tags indexed at post time and paged on /tags/<tag>?"""
+        with app.app_context():
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.testuser_id
+
+                for text in ["first #Flask post", "about #python", "more #flask, #FLASK!"]:
+                    c.post("/messages/new", data={"text": text})
+
+                self.assertEqual(MessageTag.query.filter_by(tag="flask").count(), 2)
+
+                messages, cursor = MessageTag.timeline("FLASK", per_page=1)
+                self.assertEqual([m.text for m in messages], ["more #flask, #FLASK!"])
+                messages, cursor = MessageTag.timeline("flask", before=cursor, per_page=1)
+                self.assertEqual([m.text for m in messages], ["first #Flask post"])
+                self.assertIsNone(cursor)
+
+                resp = c.get("/tags/Flask")
+                self.assertEqual(resp.status_code, 200)
+                self.assertIn('<a href="/tags/flask">#Flask</a>', str(resp.data))
+                self.assertNotIn("about", str(resp.data))
+
+    def test_deleted_author_hidden(self):
+        """Are a deleted account's messages hidden before they're purged?"""
+        with app.app_context():
+            gone = User.signup("gone", "gone@test.com", "password", None)
+            db.session.flush()
+            db.session.add(Message(id=400, text="soon #gone", user_id=gone.id))
+            db.session.flush()
+            db.session.add(MessageTag(tag="gone", message_id=400))
+            db.session.add(Follows(user_being_followed_id=gone.id,
+                                   user_following_id=self.testuser_id))
+            db.session.add(TrendingMessage(message_id=400, rank=1, score=1))
+            gone.deleted_at = datetime.utcnow()
+            db.session.commit()
+
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.testuser_id
+
+                for url in ["/", "/messages/trending", "/tags/gone"]:
+                    self.assertNotIn("soon", c.get(url).get_data(as_text=True))
+                self.assertEqual(c.get("/messages/400").status_code, 404)
+                self.assertEqual(c.get("/messages/since").json['messages'], [])
+
+    def test_mentions(self):
+        """Do @mentions notify users and bump their unread counter?"""
+        with app.app_context():
+            bob = User.signup("bob", "bob@test.com", "password", None)
+            db.session.commit()
+            bob_id = bob.id
+
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.testuser_id
+
+                c.post("/messages/new", data={"text": "hi @bob and @nobody, @testuser"})
+                c.post("/messages/new", data={"text": "@bob again @bob"})
+
+                self.assertEqual(Notification.query.count(), 2)
+
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = bob_id
+
+                resp = c.get("/notifications/unread-count")
+                self.assertEqual(resp.get_json(), {"unread": 2})
+
+                resp = c.get("/notifications")
+                self.assertIn('<a href="/users/@bob">@bob</a> again', str(resp.data))
+                self.assertEqual(c.get("/notifications/unread-count").get_json(), {"unread": 0})
+
+                # Only what the page shows is marked read.
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.testuser_id
+                c.post("/messages/new", data={"text": "@bob three"})
+                c.post("/messages/new", data={"text": "@bob four"})
+
+                self.assertEqual(Notification.mark_read(bob_id, count=1), 2)
+                db.session.commit()
+
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = bob_id
+                self.assertEqual(c.get("/notifications/unread-count").get_json(), {"unread": 1})
+
+                resp = c.get("/users/@bob")
+                self.assertEqual(resp.location, f"/users/{bob_id}")
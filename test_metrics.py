@@ -0,0 +1,68 @@
+"""Prometheus metrics tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_metrics.py
+
+
+from unittest import TestCase
+
+from prometheus_client.parser import text_string_to_metric_families
+
+from app import create_app
+from models import db, connect_db, User
+
+app = create_app('postgresql:///warbler-test', testing=True)
+connect_db(app)
+
+
+def scrape(client):
+    resp = client.get('/metrics')
+    return {(sample.name, tuple(sorted(sample.labels.items()))): sample.value
+            for family in text_string_to_metric_families(resp.get_data(as_text=True))
+            for sample in family.samples}
+
+
+class MetricsTestCase(TestCase):
+    """Test the /metrics endpoint."""
+
+    def setUp(self):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            User.signup("metered", "metered@test.com", "password", None)
+            db.session.commit()
+
+        self.client = app.test_client()
+
+    def test_metrics(self):
+        before = scrape(self.client)
+        self.client.get('/users')
+        after = scrape(self.client)
+
+        key = ('warbler_http_requests_total',
+               (('endpoint', 'list_users'), ('method', 'GET'), ('status', '200')))
+        self.assertEqual(after[key] - before.get(key, 0), 1)
+
+        key = ('warbler_http_request_duration_seconds_count', (('endpoint', 'list_users'),))
+        self.assertEqual(after[key] - before.get(key, 0), 1)
+
+        self.assertGreater(after[('warbler_db_pool_checkouts_total', ())], 0)
+        self.assertIn(('warbler_db_pool_wait_seconds_count', ()), after)
+        self.assertIn(('warbler_bcrypt_seconds_count', (('op', 'hash'),)), after)
+
+    def test_pool_gauges(self):
+        key = ('warbler_db_pool_checked_out', ())
+        with app.app_context():
+            engine = db.engine
+        before = scrape(self.client)[key]
+
+        with engine.connect(), engine.connect():
+            self.assertEqual(scrape(self.client)[key] - before, 2)
+
+        # dispose() remakes the pool; its events must still count once.
+        engine.dispose()
+        with engine.connect():
+            self.assertEqual(scrape(self.client)[key] - before, 1)
+
+        self.assertEqual(scrape(self.client)[key], before)
@@ -0,0 +1,119 @@
+"""Message partition and archive tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_partitions.py
+
+
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+
+from sqlalchemy import text
+
+import partitions
+import snowflake
+from app import create_app
+from models import db, connect_db, Likes, Message, MessageTag, Notification, User
+
+app = create_app('postgresql:///warbler-test', testing=True)
+app.config['SQLALCHEMY_ECHO'] = False
+connect_db(app)
+
+OLD_MONTH = datetime(2019, 3, 1)
+
+
+class PartitionsTestCase(TestCase):
+    """Test month partitions, pruning, and archiving a month."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        app.config['ARCHIVE_DIR'] = self.dir.name
+
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+            user = User(username="old", email="old@test.com", password="hashed")
+            db.session.add(user)
+            db.session.flush()
+            self.user_id = user.id
+
+            partitions.ensure(db.session.connection(), start=OLD_MONTH)
+            old_id = snowflake.first_id_at(datetime(2019, 3, 14))
+            db.session.add(Message(id=old_id, text="pi day #math", user_id=user.id,
+                                   timestamp=datetime(2019, 3, 14)))
+            db.session.flush()
+            db.session.add_all([MessageTag(tag="math", message_id=old_id),
+                                Likes(user_id=user.id, message_id=old_id)])
+            db.session.add(Message(text="today", user_id=user.id))
+            db.session.commit()
+            self.old_id = old_id
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_partitions(self):
+        with app.app_context():
+            conn = db.session.connection()
+            names = partitions.existing(conn)
+            this_month = partitions.month_of(datetime.utcnow())
+
+            self.assertIn('messages_default', names)
+            self.assertIn(partitions.partition_name(OLD_MONTH), names)
+            self.assertIn(partitions.partition_name(this_month), names)
+            self.assertEqual(conn.execute(text(
+                f"SELECT count(*) FROM {partitions.partition_name(this_month)}")).scalar(), 1)
+
+            # The recent half of Message.newest never looks at old months.
+            floor = snowflake.first_id_at(this_month)
+            plan = '\n'.join(conn.execute(text(
+                f"EXPLAIN SELECT * FROM messages WHERE user_id = {self.user_id} "
+                f"AND id >= {floor} ORDER BY id DESC LIMIT 100")).scalars())
+            self.assertIn(partitions.partition_name(this_month), plan)
+            self.assertNotIn(partitions.partition_name(OLD_MONTH), plan)
+
+            messages = Message.newest(Message.query.filter_by(user_id=self.user_id), 100)
+            self.assertEqual([msg.text for msg in messages], ["today", "pi day #math"])
+
+    def test_archive(self):
+        with app.app_context():
+            # Two unread notifications, the older about the archived message;
+            # one read before both.
+            reader = User(username="reader", email="reader@test.com", password="hashed",
+                          unread_notifications=2)
+            db.session.add(reader)
+            db.session.flush()
+            new_id = Message.query.filter_by(text="today").one().id
+            db.session.add_all([
+                Notification(user_id=reader.id, message_id=self.old_id,
+                             created=datetime(2019, 3, 13)),
+                Notification(user_id=reader.id, message_id=self.old_id,
+                             created=datetime(2019, 3, 14)),
+                Notification(user_id=reader.id, message_id=new_id,
+                             created=datetime(2019, 3, 15)),
+            ])
+            db.session.commit()
+            reader_id = reader.id
+
+            count = partitions.archive(db.session.connection(), OLD_MONTH, self.dir.name)
+            db.session.commit()
+
+            self.assertEqual(count, 1)
+            self.assertNotIn(partitions.partition_name(OLD_MONTH),
+                             partitions.existing(db.session.connection()))
+            self.assertIsNone(Message.query.get(self.old_id))
+            self.assertEqual(Likes.query.count(), 0)
+            self.assertEqual(Notification.query.count(), 1)
+            self.assertEqual(db.session.get(User, reader_id).unread_notifications, 1)
+
+        self.assertEqual(partitions.archived_months(self.dir.name), [OLD_MONTH])
+        [archived] = partitions.read_archive(self.dir.name, OLD_MONTH, self.user_id)
+        self.assertEqual(archived['id'], self.old_id)
+        self.assertEqual(archived['tags'], ["math"])
+        self.assertEqual(archived['liked_by'], [self.user_id])
+        self.assertEqual(archived['timestamp'], datetime(2019, 3, 14))
+
+        resp = app.test_client().get(f'/users/{self.user_id}/archive?month=2019-03')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'pi day', resp.data)
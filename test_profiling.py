@@ -0,0 +1,77 @@
+"""Request profiling tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_profiling.py
+
+
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from flask import Flask, render_template_string
+
+import profiling
+
+
+def slow():
+    time.sleep(0.05)
+    return 'done'
+
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+
+    @app.route('/work')
+    def work():
+        time.sleep(0.05)
+        return render_template_string('{{ slow() }}', slow=slow)
+
+    profiling.init_app(app)
+    return app
+
+
+class ProfilingTestCase(TestCase):
+    """Test request selection and folded stack output."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_disabled(self):
+        app = make_app(PROFILE_DIR=self.dir.name)
+        self.assertNotIsInstance(app.wsgi_app, profiling.Profiler)
+
+    def test_signed_header(self):
+        app = make_app(PROFILE_DIR=self.dir.name, PROFILE_SECRET='sekrit')
+        client = app.test_client()
+
+        client.get('/work', headers={'X-Warbler-Profile': 'forged'})
+        self.assertEqual(os.listdir(self.dir.name), [])
+
+        token = profiling._serializer('sekrit').dumps('profile')
+        resp = client.get('/work', headers={'X-Warbler-Profile': token})
+        self.assertEqual(resp.data, b'done')
+
+        [name] = os.listdir(self.dir.name)
+        self.assertIn('-work-', name)
+        with open(os.path.join(self.dir.name, name)) as f:
+            lines = f.read().splitlines()
+
+        categories = {line.split(';')[1] for line in lines}
+        self.assertEqual(categories, {'view', 'template'})
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack.startswith('work;'))
+            self.assertGreater(int(count), 0)
+        self.assertTrue(any('slow (test_profiling.py)' in line and ';template;' in line
+                            for line in lines))
+
+    def test_sample_rate(self):
+        app = make_app(PROFILE_DIR=self.dir.name, PROFILE_SAMPLE_RATE=1.0)
+        app.test_client().get('/work')
+        self.assertEqual(len(os.listdir(self.dir.name)), 1)
@@ -0,0 +1,69 @@
+"""User ranking tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_ranking.py
+
+
+from unittest import TestCase
+
+import numpy as np
+
+from app import create_app
+import ranking
+from models import db, connect_db, User, Follows
+
+app = create_app('postgresql:///warbler-test', testing=True)
+connect_db(app)
+
+
+class PageRankTestCase(TestCase):
+    """Test the vectorized PageRank."""
+
+    def test_star(self):
+        # Everyone follows node 0
+        sources = np.array([1, 2, 3])
+        targets = np.array([0, 0, 0])
+
+        rank = ranking.pagerank(sources, targets, 4)
+
+        self.assertAlmostEqual(rank.sum(), 1.0)
+        self.assertEqual(rank.argmax(), 0)
+        self.assertAlmostEqual(rank[1], rank[2])
+
+    def test_cycle_is_uniform(self):
+        rank = ranking.pagerank(np.array([0, 1, 2]), np.array([1, 2, 0]), 3)
+
+        np.testing.assert_allclose(rank, [1 / 3] * 3)
+
+
+class RankUsersTestCase(TestCase):
+    """Test writing popularity scores."""
+
+    def setUp(self):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.rollback()
+
+    def test_rank_users(self):
+        with app.app_context():
+            users = [User.signup(f"user{i}", f"user{i}@test.com", "password", None)
+                     for i in range(3)]
+            db.session.commit()
+
+            for fan in users[1:]:
+                db.session.add(Follows(user_following_id=fan.id,
+                                       user_being_followed_id=users[0].id))
+            db.session.commit()
+
+            ranking.rank_users()
+            db.session.commit()
+
+            popular = User.query.order_by(User.popularity.desc()).first()
+            self.assertEqual(popular.username, "user0")
+            self.assertAlmostEqual(
+                sum(u.popularity for u in User.query.all()), 3.0)
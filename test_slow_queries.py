@@ -0,0 +1,78 @@
+"""Slow query log tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_slow_queries.py
+
+
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from sqlalchemy import text
+
+import slow_queries
+from app import create_app
+from models import db, connect_db
+
+app = create_app('postgresql:///warbler-test', testing=True)
+connect_db(app)
+
+
+class SlowQueryTestCase(TestCase):
+    """Test logging, explaining and rate limiting slow statements."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'slow.log')
+        app.extensions['slow_queries'] = slow_queries.SlowQueryLog(
+            self.path, threshold_ms=20, per_minute=2)
+
+    def tearDown(self):
+        app.extensions.pop('slow_queries')
+        self.dir.cleanup()
+
+    def entries(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_slow_select(self):
+        with app.test_request_context('/users?q=x'):
+            db.session.execute(text("SELECT pg_sleep(0.03), :n AS n"), {'n': 7})
+            db.session.execute(text("SELECT 1")).scalar()
+            db.session.execute(text("SELECT pg_sleep(0.03), :n AS n"), {'n': 8})
+
+            # The transaction is still usable after the EXPLAIN.
+            self.assertEqual(db.session.execute(text("SELECT 2")).scalar(), 2)
+            db.session.rollback()
+
+        [entry] = self.entries()
+        self.assertEqual(entry['path'], '/users?q=x')
+        self.assertEqual(entry['params'], {'n': '7'})
+        self.assertGreaterEqual(entry['ms'], 20)
+        self.assertIn('actual time', entry['plan'])
+
+    def test_writes_not_explained(self):
+        with app.app_context():
+            db.session.execute(text(
+                "CREATE TEMP TABLE t AS SELECT pg_sleep(0.03)::text AS password"))
+            db.session.rollback()
+
+        [entry] = self.entries()
+        self.assertNotIn('plan', entry)
+        self.assertEqual(entry['params'], '<redacted>')
+        self.assertIsNone(entry['endpoint'])
+
+    def test_side_effects_not_analyzed(self):
+        with app.app_context():
+            db.session.execute(text("CREATE TEMP SEQUENCE s"))
+            db.session.execute(text("SELECT pg_sleep(0.03), nextval('s')"))
+
+            # Only the logged statement itself took a number.
+            self.assertEqual(db.session.execute(text("SELECT nextval('s')")).scalar(), 2)
+            db.session.rollback()
+
+        [entry] = self.entries()
+        self.assertIn('Result', entry['plan'])
+        self.assertNotIn('actual time', entry['plan'])
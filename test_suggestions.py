@@ -0,0 +1,70 @@
+"""Follow suggestion tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_suggestions.py
+
+
+from app import create_app
+from unittest import TestCase
+
+import jobs
+import suggestions
+from models import db, connect_db, User, Follows, FollowSuggestion
+
+app = create_app('postgresql:///warbler-test', testing=True)
+connect_db(app)
+
+
+class SuggestionTestCase(TestCase):
+    """Test friends-of-friends suggestions."""
+
+    def setUp(self):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+            self.ids = {}
+            for name in ["ann", "bob", "cat", "dan"]:
+                user = User.signup(name, f"{name}@test.com", "password", None)
+                db.session.commit()
+                self.ids[name] = user.id
+
+            # ann -> bob, ann -> cat; bob and cat both follow dan
+            for follower, followed in [("ann", "bob"), ("ann", "cat"),
+                                       ("bob", "dan"), ("cat", "dan")]:
+                db.session.add(Follows(user_following_id=self.ids[follower],
+                                       user_being_followed_id=self.ids[followed]))
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.rollback()
+
+    def test_rebuild(self):
+        with app.app_context():
+            suggestions.rebuild()
+            db.session.commit()
+
+            ann = User.query.get(self.ids["ann"])
+            suggested = FollowSuggestion.query.filter_by(user_id=ann.id).one()
+
+            self.assertEqual(suggested.suggested_user_id, self.ids["dan"])
+            self.assertEqual(suggested.mutual_count, 2)
+            self.assertEqual([u.username for u in suggestions.suggestions_for(ann)],
+                             ["dan"])
+
+    def test_follow_refreshes(self):
+        with app.app_context():
+            suggestions.rebuild()
+            db.session.commit()
+
+            ann = User.query.get(self.ids["ann"])
+            ann.following.append(User.query.get(self.ids["dan"]))
+            suggestions.on_follow_changed(ann.id, self.ids["dan"])
+            db.session.commit()
+
+            while jobs.run_one():
+                pass
+
+            self.assertEqual(suggestions.suggestions_for(ann), [])
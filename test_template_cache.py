@@ -0,0 +1,49 @@
+"""Template bytecode cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_template_cache.py
+
+
+import os
+import tempfile
+from unittest import TestCase
+
+from prometheus_client import REGISTRY
+
+import template_cache
+from app import create_app
+
+
+def lookups(result):
+    return REGISTRY.get_sample_value(
+        'warbler_cache_requests_total', {'cache': 'jinja_bytecode', 'result': result}) or 0
+
+
+class TemplateCacheTestCase(TestCase):
+    """Test precompiling templates into the bytecode cache."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        os.environ['JINJA_CACHE_DIR'] = self.dir.name
+
+    def tearDown(self):
+        del os.environ['JINJA_CACHE_DIR']
+        self.dir.cleanup()
+
+    def test_compile_all(self):
+        app = create_app('postgresql:///warbler-test', testing=True)
+        names = template_cache.compile_all(app)
+
+        self.assertIn('base.html', names)
+        self.assertIn('users/detail.html', names)
+        self.assertEqual(len(os.listdir(self.dir.name)), len(names))
+
+        # A fresh app loads from the cache instead of compiling.
+        fresh = create_app('postgresql:///warbler-test', testing=True)
+        compiled = []
+        fresh.jinja_env.compile = lambda *args, **kwargs: compiled.append(args)
+        hits, misses = lookups('hit'), lookups('miss')
+        fresh.jinja_env.get_template('base.html')
+        self.assertEqual(compiled, [])
+        self.assertEqual((lookups('hit') - hits, lookups('miss') - misses), (1, 0))
@@ -0,0 +1,85 @@
+"""Request tracing tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_tracing.py
+
+
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from app import create_app, CURR_USER_KEY
+from models import db, connect_db, User
+
+tmp = tempfile.TemporaryDirectory()
+TRACE_FILE = os.path.join(tmp.name, 'traces.jsonl')
+os.environ['TRACE_FILE'] = TRACE_FILE
+try:
+    app = create_app('postgresql:///warbler-test', testing=True)
+finally:
+    del os.environ['TRACE_FILE']
+connect_db(app)
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+def traces():
+    with open(TRACE_FILE) as f:
+        return [json.loads(line)['resourceSpans'][0]['scopeSpans'][0]['spans'] for line in f]
+
+
+class TracingTestCase(TestCase):
+    """Test span nesting, propagation and export."""
+
+    def setUp(self):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            user = User.signup("traced", "traced@test.com", "password", None)
+            db.session.commit()
+            self.user_id = user.id
+
+        if os.path.exists(TRACE_FILE):
+            os.remove(TRACE_FILE)
+        self.client = app.test_client()
+
+    def test_request_spans(self):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+        resp = self.client.get(f"/users/{self.user_id}")
+        [spans] = traces()
+        by_id = {span['spanId']: span for span in spans}
+        [root] = [span for span in spans if 'parentSpanId' not in span]
+
+        self.assertEqual(resp.headers['X-Trace-Id'], root['traceId'])
+        self.assertEqual(root['name'], 'GET /users/<int:user_id>')
+        self.assertTrue(all(span['traceId'] == root['traceId'] for span in spans))
+
+        names = [span['name'] for span in spans]
+        self.assertIn('add_user_to_g', names)
+        self.assertIn('render_template', names)
+
+        # The user lookup's SQL is a child of add_user_to_g
+        [load_user] = [span for span in spans if span['name'] == 'add_user_to_g']
+        self.assertTrue(any(span['name'] == 'sql' and span['parentSpanId'] == load_user['spanId']
+                            for span in spans))
+        for span in spans:
+            if 'parentSpanId' in span:
+                self.assertIn(span['parentSpanId'], by_id)
+
+    def test_bcrypt_and_propagation(self):
+        parent = '00-' + 'a' * 32 + '-' + 'b' * 16 + '-01'
+        resp = self.client.post("/login", data={"username": "traced", "password": "password"},
+                                headers={"traceparent": parent})
+
+        self.assertEqual(resp.headers['X-Trace-Id'], 'a' * 32)
+        [spans] = traces()
+        [root] = [span for span in spans if span['kind'] == 2]
+        self.assertEqual(root['parentSpanId'], 'b' * 16)
+        self.assertIn('bcrypt.check', [span['name'] for span in spans])
+
+        # Not sampled upstream: no trace
+        self.client.get("/login", headers={"traceparent": parent[:-2] + '00'})
+        self.assertEqual(len(traces()), 1)
@@ -0,0 +1,77 @@
+"""Profile image upload tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_uploads.py
+
+
+import io
+import os
+import tempfile
+from unittest import TestCase
+
+from PIL import Image
+
+import uploads
+from app import create_app
+
+app = create_app('postgresql:///warbler-test', testing=True)
+
+
+def png(width, height):
+    out = io.BytesIO()
+    Image.new('RGBA', (width, height), (200, 30, 30, 128)).save(out, 'PNG')
+    out.seek(0)
+    return out
+
+
+class UploadsTestCase(TestCase):
+    """Test storing, resizing and serving uploaded images."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        app.config['UPLOADS_DIR'] = self.dir.name
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_save_image(self):
+        with app.app_context():
+            url = uploads.save_image(png(900, 600), 'avatar')
+
+        self.assertRegex(url, r'^/uploads/[0-9a-f]{24}-lg\.jpg$')
+        self.assertEqual(len(os.listdir(self.dir.name)), 3)
+
+        for variant, size in uploads.VARIANTS['avatar'].items():
+            path = os.path.join(self.dir.name, os.path.basename(uploads.thumb(url, variant)))
+            with Image.open(path) as image:
+                self.assertEqual(image.size, size)
+                self.assertEqual(image.format, 'JPEG')
+
+        # Same bytes, same name
+        with app.app_context():
+            self.assertEqual(uploads.save_image(png(900, 600), 'avatar'), url)
+
+        resp = self.client.get(uploads.thumb(url, 'sm'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('immutable', resp.headers['Cache-Control'])
+        resp.close()
+
+    def test_invalid_image(self):
+        with app.app_context():
+            with self.assertRaises(uploads.InvalidImage):
+                uploads.save_image(io.BytesIO(b'not an image'), 'header')
+
+            # The header parses; the pixel data is cut off.
+            out = io.BytesIO()
+            Image.effect_noise((900, 600), 64).save(out, 'JPEG')
+            truncated = out.getvalue()[:2000]
+            with self.assertRaises(uploads.InvalidImage):
+                uploads.save_image(io.BytesIO(truncated), 'header')
+
+    def test_thumb(self):
+        remote = 'https://example.com/me.jpg'
+        self.assertEqual(uploads.thumb(remote, 'sm'), remote)
+        self.assertEqual(uploads.thumb('/uploads/' + 'a' * 24 + '-lg.jpg', 'md'),
+                         '/uploads/' + 'a' * 24 + '-md.jpg')
@@ -6,9 +6,10 @@
 
 
 import os
+from datetime import datetime
 from unittest import TestCase
 
-from models import db, User, Message, Follows
+from models import db, connect_db, User, Message, Follows
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -23,6 +24,7 @@ from models import db, User, Message, Follows
 from app import create_app
 
 app = create_app('postgresql:///warbler-test', testing=True)
+connect_db(app)
 
 # Create our tables (we do this here, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
@@ -147,3 +149,29 @@ class UserModelTestCase(TestCase):
             self.assertEqual(auth_user.id, signup.id)
 
 
+
+    def test_followers_page(self):
+        """Are followers paged newest follow first, with a cursor?"""
+
+        with app.app_context():
+            star = User.signup("star", "star@email.com", "password", None)
+            fans = [User.signup(f"fan{i}", f"fan{i}@email.com", "password", None)
+                    for i in range(3)]
+            db.session.commit()
+
+            for i, fan in enumerate(fans):
+                db.session.add(Follows(
+                    user_being_followed_id=star.id,
+                    user_following_id=fan.id,
+                    created=datetime(2024, 1, i + 1)))
+            db.session.commit()
+
+            page, cursor = star.followers_page(per_page=2)
+            self.assertEqual([u.username for u in page], ["fan2", "fan1"])
+            self.assertIsNotNone(cursor)
+
+            page, cursor = star.followers_page(before=cursor, per_page=2)
+            self.assertEqual([u.username for u in page], ["fan0"])
+            self.assertIsNone(cursor)
+
+            self.assertEqual(star.followers_count, 3)
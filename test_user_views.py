@@ -6,9 +6,14 @@
 
 from app import create_app, CURR_USER_KEY
 import os
+import tempfile
 from unittest import TestCase
 from bs4 import BeautifulSoup
-from models import db, connect_db, Message, User, Likes, Follows
+import accounts
+import follow_graph
+import jobs
+import suggestions
+from models import db, connect_db, Message, User, Likes, Follows, FollowSuggestion
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -18,6 +23,7 @@ from models import db, connect_db, Message, User, Likes, Follows
 # os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
 
 app = create_app('postgresql:///warbler-test', testing=True)
+connect_db(app)
 
 # Don't have WTForms use CSRF at all, since it's a pain to test
 app.config['WTF_CSRF_ENABLED'] = False
@@ -206,6 +212,72 @@ class UserViewTestCase(TestCase):
             db.session.add_all([f1, f2, f3])
             db.session.commit()
 
+    def test_purge_unfollows(self):
+        """Are a purged user's follows taken out of the graph and suggestions?"""
+        with tempfile.TemporaryDirectory() as tmp, app.app_context():
+            self.setup_followers()
+            suggestions.rebuild()
+            db.session.commit()
+            self.assertEqual(
+                FollowSuggestion.query.filter_by(user_id=self.u1_id).count(), 1)
+
+            old_path = app.config['FOLLOW_GRAPH_PATH']
+            app.config['FOLLOW_GRAPH_PATH'] = path = os.path.join(tmp, 'follows.graph')
+            app.extensions.pop('follow_graph', None)
+            try:
+                with db.engine.connect() as connection:
+                    follow_graph.build(path, connection)
+
+                accounts.soft_delete_user(User.query.get(self.testuser_id))
+                db.session.commit()
+                while jobs.run_one():
+                    pass
+
+                graph = follow_graph.FollowGraph(path)
+                graph._refresh(force=True)
+                self.assertFalse(graph.follows(self.testuser_id, self.u1_id))
+                self.assertFalse(graph.follows(self.u1_id, self.testuser_id))
+                self.assertEqual(
+                    FollowSuggestion.query.filter_by(user_id=self.u1_id).count(), 0)
+            finally:
+                app.config['FOLLOW_GRAPH_PATH'] = old_path
+                app.extensions.pop('follow_graph', None)
+
+    def test_show_liked_messages(self):
+        with app.app_context():
+            self.setup_likes()
+            for i in range(3):
+                m = Message(text=f"liked {i}", user_id=self.u1_id)
+                db.session.add(m)
+                db.session.flush()
+                db.session.add(Likes(user_id=self.testuser_id, message_id=m.id))
+            db.session.commit()
+
+            with self.client as c:
+                resp = c.get(f"/users/{self.testuser_id}/liked-messages")
+                self.assertEqual(resp.status_code, 302)
+
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.testuser_id
+
+                user = User.query.get(self.testuser_id)
+                page, cursor = user.liked_messages_page(per_page=2)
+                self.assertEqual([m.text for m in page], ["liked 2", "liked 1"])
+                page, cursor = user.liked_messages_page(before=cursor, per_page=2)
+                self.assertEqual([m.text for m in page], ["liked 0", "likable warble"])
+                self.assertIsNone(cursor)
+
+                resp = c.get(f"/users/{self.testuser_id}/liked-messages")
+                self.assertEqual(resp.status_code, 200)
+                self.assertIn("likable warble", str(resp.data))
+                self.assertNotIn("Older", str(resp.data))
+
+                resp = c.get(f"/users/{self.testuser_id}/liked-messages?stream=1")
+                self.assertEqual(resp.status_code, 200)
+                self.assertTrue(resp.is_streamed)
+                for text in ("liked 0", "liked 2", "likable warble"):
+                    self.assertIn(text, str(resp.data))
+
     def test_user_show_with_follows(self):
         with app.app_context():
             self.setup_followers()
@@ -279,3 +351,33 @@ class UserViewTestCase(TestCase):
                 self.assertEqual(resp.status_code, 200)
                 self.assertNotIn("@abc", str(resp.data))
                 self.assertIn("Access unauthorized", str(resp.data))
+
+    def test_delete_user(self):
+        with app.app_context():
+            self.setup_likes()
+            self.setup_followers()
+
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.testuser_id
+
+                resp = c.post("/users/delete")
+                self.assertEqual(resp.status_code, 302)
+
+                # Hidden right away, purged by the background job
+                self.assertIsNotNone(User.query.get(self.testuser_id).deleted_at)
+                resp = c.get(f"/users/{self.testuser_id}")
+                self.assertEqual(resp.status_code, 404)
+                resp = c.get("/users")
+                self.assertNotIn("@testuser", str(resp.data))
+
+                while jobs.run_one():
+                    pass
+
+                self.assertIsNone(User.query.get(self.testuser_id))
+                self.assertEqual(
+                    Message.query.filter_by(user_id=self.testuser_id).count(), 0)
+                self.assertEqual(
+                    Likes.query.filter_by(user_id=self.testuser_id).count(), 0)
+                self.assertEqual(
+                    Follows.query.filter_by(user_following_id=self.testuser_id).count(), 0)
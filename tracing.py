@@ -0,0 +1,227 @@
+"""Request tracing, written as OpenTelemetry (OTLP/JSON) spans.
+
+With TRACE_FILE set, each sampled request gets a root span. Spans for
+add_user_to_g, every SQL statement, every template render and every bcrypt
+call hang off it. An incoming W3C `traceparent` header joins the caller's
+trace, and every traced response carries `traceparent` and `X-Trace-Id`
+headers. A finished trace is appended to TRACE_FILE as one line in the
+OTLP/JSON shape that the OpenTelemetry collector's file receiver and
+otel-desktop-viewer read.
+
+Code opens a span with `with tracing.span('name', key=value):`. Outside a
+traced request this does nothing, so spans can go anywhere.
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# OTLP SpanKind values
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current = ContextVar('warbler_span', default=None)
+_write_lock = threading.Lock()
+
+
+def _id(nbytes):
+    return f'{random.getrandbits(nbytes * 8):0{nbytes * 2}x}'
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        encoded = {'boolValue': value}
+    elif isinstance(value, int):
+        encoded = {'intValue': str(value)}
+    elif isinstance(value, float):
+        encoded = {'doubleValue': value}
+    else:
+        encoded = {'stringValue': str(value)}
+    return {'key': key, 'value': encoded}
+
+
+class Span:
+    """One timed operation within a trace."""
+
+    def __init__(self, trace, name, parent_id, kind, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = _id(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.error = None
+        self.start = time.time_ns()
+        self.end = None
+        trace.spans.append(self)
+
+    def child(self, name, kind=INTERNAL, **attributes):
+        return Span(self.trace, name, self.span_id, kind, attributes)
+
+    def finish(self):
+        self.end = time.time_ns()
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end or time.time_ns()),
+            'attributes': [_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class Trace:
+    """The spans of one request, written out together when it ends."""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or _id(16)
+        self.spans = []
+
+    def export(self, path):
+        line = json.dumps({'resourceSpans': [{
+            'resource': {'attributes': [_attribute('service.name', 'warbler')]},
+            'scopeSpans': [{
+                'scope': {'name': 'warbler.tracing'},
+                'spans': [span.to_otlp() for span in self.spans],
+            }],
+        }]})
+        with _write_lock, open(path, 'a') as f:
+            f.write(line + '\n')
+
+
+def start_span(name, kind=INTERNAL, **attributes):
+    """Open a child of the current span; returns (span, token) or None."""
+
+    parent = _current.get()
+    if parent is None:
+        return None
+    child = parent.child(name, kind, **attributes)
+    return child, _current.set(child)
+
+
+def end_span(started, error=None):
+    """Close a span opened with start_span."""
+
+    if started is None:
+        return
+    child, token = started
+    child.error = error
+    child.finish()
+    _current.reset(token)
+
+
+@contextmanager
+def span(name, kind=INTERNAL, **attributes):
+    """Time the block as a child of the current span, if there is one."""
+
+    started = start_span(name, kind, **attributes)
+    try:
+        yield started[0] if started else None
+    except BaseException as e:
+        end_span(started, repr(e))
+        started = None
+        raise
+    finally:
+        end_span(started)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_sql_span(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('trace_spans', []).append(
+            start_span('sql', CLIENT, **{'db.system': 'postgresql', 'db.statement': statement}))
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_sql_span(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get('trace_spans')
+    if spans:
+        end_span(spans.pop())
+
+
+@event.listens_for(Engine, 'handle_error')
+def _fail_sql_span(context):
+    spans = context.connection.info.get('trace_spans') if context.connection else None
+    if spans:
+        end_span(spans.pop(), repr(context.original_exception))
+
+
+def _start_template_span(app, template, context, **extra):
+    started = start_span('render_template', template=template.name or '<string>')
+    if started:
+        g.setdefault('trace_template_spans', []).append(started)
+
+
+def _end_template_span(app, template, context, **extra):
+    spans = g.get('trace_template_spans')
+    if spans:
+        end_span(spans.pop())
+
+
+def init_app(app):
+    """Trace requests to TRACE_FILE, if it's set."""
+
+    path = app.config.get('TRACE_FILE')
+    if not path:
+        return
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    sample_rate = app.config.get('TRACE_SAMPLE_RATE', 1.0)
+
+    before_render_template.connect(_start_template_span, app)
+    template_rendered.connect(_end_template_span, app)
+
+    @app.before_request
+    def start_trace():
+        trace_id = parent_id = None
+        match = TRACEPARENT.match(request.headers.get('traceparent', ''))
+        if match:
+            trace_id, parent_id, flags = match.groups()
+            if not int(flags, 16) & 1:
+                return
+        elif random.random() >= sample_rate:
+            return
+
+        root = Span(Trace(trace_id), f'{request.method} {request.url_rule or request.path}',
+                    parent_id, SERVER, {
+                        'http.method': request.method,
+                        'http.target': request.full_path,
+                        'flask.endpoint': request.endpoint or '',
+                    })
+        g.trace_root = root, _current.set(root)
+
+    @app.after_request
+    def add_trace_headers(response):
+        if 'trace_root' in g:
+            root, token = g.trace_root
+            root.attributes['http.status_code'] = response.status_code
+            response.headers['traceparent'] = f'00-{root.trace.trace_id}-{root.span_id}-01'
+            response.headers['X-Trace-Id'] = root.trace.trace_id
+        return response
+
+    @app.teardown_request
+    def end_trace(exc):
+        if 'trace_root' not in g:
+            return
+        root, token = g.pop('trace_root')
+        root.error = repr(exc) if exc else None
+        root.finish()
+        _current.reset(token)
+        root.trace.export(path)
@@ -0,0 +1,106 @@
+"""Trending messages, ranked by how fast they're being liked.
+
+Every like and unlike adds +1/-1 to the message's counter for the current
+time bucket in `like_buckets`. A periodic job sums the buckets inside the
+sliding window, keeps the top messages by likes per hour in
+`trending_messages`, and prunes buckets that have left the window. Serving
+the trending page reads those few rows and never touches `likes`.
+
+The job queues its own next run, so once `flask trending refresh` (or any
+like) has started it, the list keeps aging out old likes with no new ones.
+"""
+
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+import jobs
+from models import db, LikeBucket
+
+BUCKET = timedelta(minutes=5)
+WINDOW = timedelta(hours=24)
+REFRESH_INTERVAL = timedelta(minutes=1)
+TOP_K = 50
+
+REFRESH_SQL = """
+    INSERT INTO trending_messages (rank, message_id, score)
+    SELECT row_number() OVER (ORDER BY score DESC, message_id DESC), message_id, score
+    FROM (
+        SELECT message_id, sum(likes)::float / :hours AS score
+        FROM like_buckets
+        WHERE bucket >= :since
+        GROUP BY message_id
+        HAVING sum(likes) > 0
+        ORDER BY score DESC, message_id DESC
+        LIMIT :k
+    ) top
+"""
+
+
+def _floor(moment, step):
+    epoch = datetime(1970, 1, 1)
+    return moment - (moment - epoch) % step
+
+
+def record_like(message_id, delta):
+    """Count a like (+1) or unlike (-1) in the current bucket."""
+
+    stmt = insert(LikeBucket).values(
+        message_id=message_id,
+        bucket=_floor(datetime.utcnow(), BUCKET),
+        likes=delta,
+    )
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['message_id', 'bucket'],
+        set_={'likes': LikeBucket.likes + stmt.excluded.likes}))
+
+    schedule_refresh()
+
+
+def schedule_refresh():
+    """Make sure a refresh is queued for the next interval.
+
+    The dedupe key names the interval, so this is a cheap no-op when one is
+    already queued.
+    """
+
+    run_at = _floor(datetime.utcnow(), REFRESH_INTERVAL) + REFRESH_INTERVAL
+    jobs.enqueue('refresh_trending', dedupe_key=f'refresh_trending:{run_at.isoformat()}',
+                 run_at=run_at)
+
+
+def refresh():
+    """Recompute the top-K table from the buckets in the window."""
+
+    since = datetime.utcnow() - WINDOW
+
+    db.session.execute(text("DELETE FROM trending_messages"))
+    db.session.execute(text(REFRESH_SQL), {
+        'hours': WINDOW.total_seconds() / 3600,
+        'since': since,
+        'k': TOP_K,
+    })
+    db.session.execute(text("DELETE FROM like_buckets WHERE bucket < :since"),
+                       {'since': since - BUCKET})
+
+
+@jobs.job('refresh_trending')
+def refresh_job():
+    refresh()
+    schedule_refresh()
+
+
+cli = AppGroup('trending', help="Maintain trending messages.")
+
+
+@cli.command('refresh')
+def refresh_command():
+    """Recompute trending messages now, and keep them refreshing."""
+
+    refresh()
+    schedule_refresh()
+    db.session.commit()
+    click.echo("Refreshed trending messages.")
@@ -0,0 +1,119 @@
+"""Locally stored profile and header images.
+
+An upload is decoded once and re-encoded into a fixed set of JPEG sizes
+(VARIANTS); the original is never kept, which also drops any EXIF data.
+Every size is named after a hash of the uploaded bytes, so the files never
+change once written and are served with immutable caching.
+
+`User.image_url` / `header_image_url` store the URL of the largest size.
+Templates ask for a smaller one with the `thumb` filter, e.g.
+`{{ user.image_url | thumb('sm') }}`; remote URLs pass through unchanged.
+"""
+
+import hashlib
+import io
+import os
+import re
+
+from flask import current_app, send_from_directory
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from assets import IMMUTABLE
+
+# Pixel sizes are twice the CSS box, for high-density screens. Bump
+# VERSION whenever these change, so new files get new names.
+VERSION = 1
+VARIANTS = {
+    'avatar': {
+        'sm': (96, 96),       # .timeline-image, nav
+        'md': (140, 140),     # .card-image
+        'lg': (400, 400),     # #profile-avatar
+    },
+    'header': {
+        'md': (700, 280),     # .card-hero
+        'lg': (1920, 720),    # #warbler-hero
+    },
+}
+LARGEST = 'lg'
+
+URL_PREFIX = '/uploads/'
+UPLOAD_URL = re.compile(r'^/uploads/([0-9a-f]{24})-[a-z]+\.jpg$')
+
+# Refuse decompression bombs well before Pillow's own 89M pixel limit.
+MAX_PIXELS = 40_000_000
+
+
+class InvalidImage(ValueError):
+    """The upload isn't an image we can read."""
+
+
+def _encode(image, size):
+    image = ImageOps.fit(image, size, Image.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=82, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def _open(data):
+    # Pillow decodes lazily, so the conversion has to be inside the try for
+    # a truncated or corrupt file to be caught here.
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > MAX_PIXELS:
+            raise InvalidImage("Image is too large.")
+        image = ImageOps.exif_transpose(image)
+
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        return image.convert('RGB')
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise InvalidImage("Not a readable image.")
+
+
+def save_image(file, kind):
+    """Store resized copies of an uploaded image; return the largest's URL.
+
+    `file` is a file-like object (e.g. a werkzeug FileStorage) and `kind`
+    is 'avatar' or 'header'. Raises InvalidImage for anything Pillow can't
+    decode. Uploading the same image twice reuses the existing files.
+    """
+
+    data = file.read()
+    key = hashlib.sha256(f'{kind}:{VERSION}:'.encode() + data).hexdigest()[:24]
+    upload_dir = current_app.config['UPLOADS_DIR']
+    os.makedirs(upload_dir, exist_ok=True)
+
+    image = None
+    for variant, size in VARIANTS[kind].items():
+        path = os.path.join(upload_dir, f'{key}-{variant}.jpg')
+        if os.path.exists(path):
+            continue
+        if image is None:
+            image = _open(data)
+
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_encode(image, size))
+        os.replace(tmp, path)
+
+    return f'{URL_PREFIX}{key}-{LARGEST}.jpg'
+
+
+def thumb(url, variant):
+    """The URL of `variant` for an uploaded image; other URLs unchanged."""
+
+    match = UPLOAD_URL.match(url or '')
+    if not match:
+        return url
+    return f'{URL_PREFIX}{match.group(1)}-{variant}.jpg'
+
+
+def send_upload(filename):
+    """Serve a stored image; names are content hashes, so cache forever."""
+
+    response = send_from_directory(current_app.config['UPLOADS_DIR'], filename)
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response